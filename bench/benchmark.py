@@ -0,0 +1,202 @@
+"""オフライン負荷試験ハーネス
+
+偽のHyperliquid WebSocketサーバー（userFills）と偽のDiscord Webhookを立ち上げ、
+実際のhyperliquid-discord-monitor.pyをサブプロセスで起動してfillを再生する。
+fill送信からWebhook受信までのレイテンシ（p50/p99）と、監視プロセスのCPU時間・RSSを出力する。
+
+    python bench/benchmark.py --addresses 200 --rate 50 --duration 30 --shard-size 50
+    python bench/benchmark.py --fixture bench/fixtures/sample_fills.jsonl
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONITOR_SCRIPT = os.path.join(ROOT, "hyperliquid-discord-monitor.py")
+HASH_PATTERN = re.compile(r"Hash: (0x[0-9a-f]+)")
+
+sent_at = {}
+received_at = {}
+webhook_posts = [0]
+
+class FakeDiscordHandler(BaseHTTPRequestHandler):
+    """受信したメッセージ内のHashを取り出して受信時刻を記録する"""
+
+    def do_POST(self):
+        now = time.perf_counter()
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        webhook_posts[0] += 1
+        for tx_hash in HASH_PATTERN.findall(body.get("content", "")):
+            received_at.setdefault(tx_hash, now)
+        self.send_response(204)
+        self.send_header("X-RateLimit-Remaining", "1000")
+        self.send_header("X-RateLimit-Reset-After", "1")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def load_fixture(path: str) -> list:
+    """1行1fillのJSONL。userFillsメッセージ全体の行はfillsを展開する"""
+    fills = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("channel") == "userFills":
+                fills.extend(record["data"]["fills"])
+            else:
+                fills.append(record)
+    return fills
+
+def synthetic_fills() -> list:
+    coins = ["BTC", "ETH", "SOL", "HYPE"]
+    directions = ["Open Long", "Open Short", "Close Long", "Close Short"]
+    return [
+        {
+            "coin": coin, "px": "100.0", "sz": "1.0", "side": "B", "dir": direction,
+            "closedPnl": "0.0", "fee": "0.1", "feeToken": "USDC", "startPosition": "0.0",
+        }
+        for coin in coins for direction in directions
+    ]
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def read_process_stats(pid: int) -> dict:
+    """/procから監視プロセスのCPU時間とRSSを読む（Linuxのみ）"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    stats = {"cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key, value = line.split(":")
+                stats[key] = int(value.split()[0]) // 1024
+    return stats
+
+async def run_benchmark(args) -> int:
+    addresses = [f"0x{i:040x}" for i in range(1, args.addresses + 1)]
+    templates = load_fixture(args.fixture) if args.fixture else synthetic_fills()
+    subscribers = {}
+    all_subscribed = asyncio.Event()
+
+    async def ws_handler(ws):
+        async for raw in ws:
+            message = json.loads(raw)
+            if message.get("method") == "ping":
+                await ws.send(json.dumps({"channel": "pong"}))
+            elif message.get("method") == "subscribe":
+                user = message["subscription"]["user"]
+                subscribers[user] = ws
+                await ws.send(json.dumps({"channel": "subscriptionResponse", "data": message}))
+                # 実サーバーと同様に購読直後は空のスナップショットを返す
+                await ws.send(json.dumps({"channel": "userFills", "data": {"user": user, "isSnapshot": True, "fills": []}}))
+                if len(subscribers) == len(addresses):
+                    all_subscribed.set()
+
+    discord = ThreadingHTTPServer(("127.0.0.1", 0), FakeDiscordHandler)
+    threading.Thread(target=discord.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="hl-bench-")
+    addresses_file = os.path.join(workdir, "addresses.txt")
+    with open(addresses_file, "w") as f:
+        f.write("\n".join(addresses) + "\n")
+
+    async with websockets.serve(ws_handler, "127.0.0.1", 0, max_size=None) as server:
+        ws_port = server.sockets[0].getsockname()[1]
+        env = dict(
+            os.environ,
+            HYPERLIQUID_WS_URL=f"ws://127.0.0.1:{ws_port}",
+            DISCORD_WEBHOOK_URL=f"http://127.0.0.1:{discord.server_port}/webhook",
+            DB_DIRECTORY=workdir,
+            HEALTHCHECK_FILE=os.path.join(workdir, "healthcheck.txt"),
+            MULTIPLEX_SHARD_SIZE=str(args.shard_size),
+            STARTUP_GRACE_SECONDS="0",
+            NOTIFICATION_SUPPRESSION_SECONDS=str(args.suppression),
+            RECONNECT_MAX_CONCURRENT=str(max(10, args.addresses)),
+        )
+        log = open(args.log, "w") if args.log else subprocess.DEVNULL
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, MONITOR_SCRIPT, addresses_file], env=env, stdout=log, stderr=log, cwd=workdir)
+        try:
+            await asyncio.wait_for(all_subscribed.wait(), timeout=args.startup_timeout)
+            startup_seconds = time.perf_counter() - started
+            baseline = read_process_stats(process.pid)
+
+            interval = 1.0 / args.rate
+            total = int(args.rate * args.duration)
+            fills = itertools.cycle(templates)
+            next_send = time.perf_counter()
+            for i in range(total):
+                address = addresses[i % len(addresses)]
+                fill = dict(next(fills))
+                fill["hash"] = f"0x{i + 1:064x}"
+                fill["time"] = int(time.time() * 1000)
+                message = json.dumps({"channel": "userFills", "data": {"user": address, "fills": [fill]}})
+                sent_at[fill["hash"]] = time.perf_counter()
+                await subscribers[address].send(message)
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            deadline = time.perf_counter() + args.drain_timeout
+            while len(received_at) < len(sent_at) and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+            final = read_process_stats(process.pid)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            discord.shutdown()
+
+    latencies = [(received_at[h] - sent_at[h]) * 1000 for h in sent_at if h in received_at]
+    cpu_seconds = final["cpu_seconds"] - baseline["cpu_seconds"]
+    print(f"addresses={args.addresses} shard_size={args.shard_size} rate={args.rate}/s duration={args.duration}s")
+    print(f"startup (all subscribed): {startup_seconds:.2f}s")
+    print(f"fills sent: {len(sent_at)}  notified: {len(latencies)}  webhook posts: {webhook_posts[0]}")
+    print(f"latency ms: p50={percentile(latencies, 50):.1f} p99={percentile(latencies, 99):.1f} max={max(latencies, default=float('nan')):.1f}")
+    print(f"monitor cpu: {cpu_seconds:.2f}s ({cpu_seconds / args.duration * 100:.1f}% of one core)")
+    print(f"monitor rss: {final.get('VmRSS')} MiB (peak {final.get('VmHWM')} MiB)")
+    return 0 if len(latencies) == len(sent_at) else 1
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline load test for hyperliquid-discord-monitor",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--addresses", type=int, default=50, help="Number of synthetic addresses")
+    parser.add_argument("--rate", type=float, default=20, help="Fills per second across all addresses")
+    parser.add_argument("--duration", type=float, default=10, help="Replay duration in seconds")
+    parser.add_argument("--shard-size", type=int, default=0, help="MULTIPLEX_SHARD_SIZE for the monitor")
+    parser.add_argument("--suppression", type=int, default=0, help="NOTIFICATION_SUPPRESSION_SECONDS for the monitor")
+    parser.add_argument("--fixture", help="JSONL file of recorded fills (or userFills messages) to replay")
+    parser.add_argument("--log", help="Write monitor stdout/stderr to this file")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run_benchmark(args)))
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,209 @@
+from __future__ import annotations
+
 import sys
 import os
 import time
+
+# 起動時間の計測用（以降のimportの時間も含める）
+PROCESS_STARTED_AT = time.perf_counter()
+
 import signal
 import atexit
 import argparse
 import subprocess
 import asyncio
+from contextlib import asynccontextmanager
 import threading
-from websocket._exceptions import WebSocketConnectionClosedException
-from hyperliquid_monitor.monitor import HyperliquidMonitor
-from hyperliquid_monitor.types import Trade
+import queue
+import sqlite3
+import importlib
+from abc import ABC, abstractmethod
 from datetime import datetime
-from collections import defaultdict
-import requests
+from collections import defaultdict, OrderedDict, deque
 import json
+import logging
+import logging.handlers
+import struct
+import functools
+import heapq
+import random
+import hashlib
+from urllib.parse import urlsplit, parse_qsl
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from hyperliquid_monitor.types import Trade
+
+class LazyModule:
+    """属性に初めてアクセスした時点でimportするモジュール"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# 重いモジュールは使うまでimportしない（--daemon や --query は読み込まずに済む）
+websockets = LazyModule('websockets')
+requests = LazyModule('requests')
+hyperliquid_types = LazyModule('hyperliquid_monitor.types')
+hyperliquid_database = LazyModule('hyperliquid_monitor.database')
+
 load_dotenv()
 
 # .envから各種設定を読み込む
 NOTIFICATION_SUPPRESSION_SECONDS = int(os.getenv('NOTIFICATION_SUPPRESSION_SECONDS', 60))
-WEBSOCKET_ACTIVITY_TIMEOUT = int(os.getenv('WEBSOCKET_ACTIVITY_TIMEOUT', 900)) # 15分
+STARTUP_GRACE_SECONDS = int(os.getenv('STARTUP_GRACE_SECONDS', 60)) # 接続直後の履歴fillを通知しない時間
 DB_DIRECTORY = os.getenv('DB_DIRECTORY', '.') # デフォルトはカレントディレクトリ
 HEALTHCHECK_FILE = os.getenv('HEALTHCHECK_FILE', '/tmp/healthcheck.txt')
+DISCORD_QUEUE_SIZE = int(os.getenv('DISCORD_QUEUE_SIZE', 1000)) # 送信待ちメッセージの上限
+DISCORD_MAX_RETRIES = int(os.getenv('DISCORD_MAX_RETRIES', 5))
+DISCORD_REQUEST_TIMEOUT = float(os.getenv('DISCORD_REQUEST_TIMEOUT', 10)) # 秒
+DEDUP_CACHE_MAX_ENTRIES = int(os.getenv('DEDUP_CACHE_MAX_ENTRIES', 100000)) # 重複チェックキャッシュの最大件数
+DEDUP_CACHE_MAX_BYTES = int(os.getenv('DEDUP_CACHE_MAX_BYTES', 0)) # 0で件数のみで制限
+DEDUP_CACHE_TTL_SECONDS = int(os.getenv('DEDUP_CACHE_TTL_SECONDS', 86400)) # 1日
+HYPERLIQUID_WS_URL = os.getenv('HYPERLIQUID_WS_URL', 'wss://api.hyperliquid.xyz/ws')
+WEBSOCKET_PING_INTERVAL = int(os.getenv('WEBSOCKET_PING_INTERVAL', 20)) # 秒
+WEBSOCKET_MAX_MISSED_PONGS = int(os.getenv('WEBSOCKET_MAX_MISSED_PONGS', 2)) # pongがこの回数続けて返らなければ再接続
+WEBSOCKET_CLOSE_TIMEOUT = float(os.getenv('WEBSOCKET_CLOSE_TIMEOUT', 2)) # 切断時にclose応答を待つ秒数（超えたらソケットを破棄）
+RTT_HISTORY_SIZE = int(os.getenv('RTT_HISTORY_SIZE', 30)) # 接続毎に保持するRTTの件数
+RECONNECT_BASE_DELAY = float(os.getenv('RECONNECT_BASE_DELAY', 1)) # 秒
+RECONNECT_MAX_DELAY = float(os.getenv('RECONNECT_MAX_DELAY', 300)) # 秒
+RECONNECT_MAX_CONCURRENT = int(os.getenv('RECONNECT_MAX_CONCURRENT', 10)) # 同時ハンドシェイク数の上限
+RECONNECT_STABLE_SECONDS = float(os.getenv('RECONNECT_STABLE_SECONDS', 60)) # この時間接続が続けばバックオフをリセット
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0)) # 0でメトリクスエンドポイント無効
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+ADDRESSES_RELOAD_INTERVAL = int(os.getenv('ADDRESSES_RELOAD_INTERVAL', 10)) # 秒（0でファイル監視無効、SIGHUPは常に有効）
+ARCHIVE_DB_PATH = os.getenv('ARCHIVE_DB_PATH', '') # 設定すると全アドレス共通のDBに書き込む
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+ARCHIVE_FLUSH_INTERVAL = float(os.getenv('ARCHIVE_FLUSH_INTERVAL', 0.5)) # 秒
+STATE_SNAPSHOT_PATH = os.getenv('STATE_SNAPSHOT_PATH', '') # 設定すると重複チェック等の状態を保存し、猶予期間の代わりにウォーターマークを使う
+STATE_SNAPSHOT_INTERVAL = int(os.getenv('STATE_SNAPSHOT_INTERVAL', 30)) # 秒
+AGGREGATION_WINDOW_SECONDS = float(os.getenv('AGGREGATION_WINDOW_SECONDS', 0)) # 0で集約しない
+NOTIFICATION_ROUTES_FILE = os.getenv('NOTIFICATION_ROUTES_FILE', '') # 通知先のルーティング設定（JSON）
+PRIORITY_MIN_NOTIONAL = float(os.getenv('PRIORITY_MIN_NOTIONAL', 0)) # size×priceがこの値以上のトレードを優先レーンで送る（0で無効）
+PRIORITY_MIN_PNL = float(os.getenv('PRIORITY_MIN_PNL', 0)) # closed_pnlの絶対値がこの値以上のトレードを優先（0で無効）
+PRIORITY_COINS = {coin.strip() for coin in os.getenv('PRIORITY_COINS', '').split(',') if coin.strip()} # 常に優先するコイン（例: BTC,ETH）
+STARTUP_WAVE_SIZE = int(os.getenv('STARTUP_WAVE_SIZE', os.getenv('RECONNECT_MAX_CONCURRENT', 10))) # 起動時に同時に接続を始めるshard数
+STARTUP_WAVE_INTERVAL = float(os.getenv('STARTUP_WAVE_INTERVAL', 0.25)) # 起動時の接続ウェーブの間隔（秒、0で間隔なし）
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000)) # 受信したfillの処理待ちの上限
+INGEST_OVERLOAD_POLICY = os.getenv('INGEST_OVERLOAD_POLICY', 'spill') # 処理待ちが上限に達した時: spill / coalesce / drop
+INGEST_SPILL_PATH = os.getenv('INGEST_SPILL_PATH', '') # spill時の退避先（デフォルトはDB_DIRECTORY/ingest_spill.jsonl）
+DIGEST_INTERVALS = [name.strip() for name in os.getenv('DIGEST_INTERVALS', '').split(',') if name.strip()] # アドレス毎の集計を送る間隔（hourly,daily）
+RECENT_TRADES_SIZE = int(os.getenv('RECENT_TRADES_SIZE', 1000)) # /trades で返す直近トレードのリングバッファの件数
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json') # json または text
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000)) # 出力待ちログの上限（溢れた分は破棄）
+LOG_REPEAT_INTERVAL = float(os.getenv('LOG_REPEAT_INTERVAL', 60)) # 同じ内容のログはこの秒数に1回だけ出力（0で無効）
+ADDRESS_LOG_LEVELS = os.getenv('ADDRESS_LOG_LEVELS', '') # アドレス毎のログレベル（例: 0xabc=DEBUG,0xdef=WARNING）
+WORKER_STOP_TIMEOUT = float(os.getenv('WORKER_STOP_TIMEOUT', 50)) # 停止時にワーカーの後片付け（処理待ちのfill・通知・スナップショット）を待つ秒数
+MULTIPLEX_SHARD_SIZE = int(os.getenv('MULTIPLEX_SHARD_SIZE', 0)) # 1接続あたりのアドレス数（0で従来のアドレス毎接続）
+
+logger = logging.getLogger("hyperliquid_monitor")
 
 # DB保存ディレクトリが存在しない場合は作成
 if DB_DIRECTORY != '.':
     os.makedirs(DB_DIRECTORY, exist_ok=True)
-    print(f"Database directory set to: {DB_DIRECTORY}")
+
+class BoundedDedupCache:
+    """LRU + TTLで件数を制限した重複チェック用キャッシュ（キーは16バイトのハッシュで保持）"""
+
+    # OrderedDictのノード + 16バイトのbytes + floatのおおよそのサイズ
+    ENTRY_BYTES = 180
+
+    def __init__(self, max_entries: int, ttl_seconds: float, max_bytes: int = 0):
+        if max_bytes > 0:
+            max_entries = min(max_entries, max(1, max_bytes // self.ENTRY_BYTES))
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(value: str) -> bytes:
+        return hashlib.blake2b(value.encode(), digest_size=16).digest()
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl_seconds
+        while self._entries:
+            key, touched_at = next(iter(self._entries.items()))
+            if touched_at >= cutoff:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def __contains__(self, value: str) -> bool:
+        key = self.make_key(value)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                self._entries[key] = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, value: str) -> bool:
+        """追加する。新規に追加された場合はTrueを返す"""
+        key = self.make_key(value)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            is_new = key not in self._entries
+            self._entries[key] = now
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return is_new
+
+    def dump_keys(self) -> bytes:
+        """LRU順（古い順）にキーを連結したバイト列"""
+        with self._lock:
+            return b"".join(self._entries)
+
+    def load_keys(self, data: bytes):
+        """dump_keysの出力から復元（TTLは読み込み時点から数え直す）"""
+        now = time.monotonic()
+        with self._lock:
+            for offset in range(0, len(data), 16):
+                self._entries[data[offset:offset + 16]] = now
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
 
 last_notification_time = defaultdict(float)
 
-trade_cache = defaultdict(list)
+# 通知済みtx_hash（同じtx_hashの2件目以降のfillは通知しない）
+trade_cache = BoundedDedupCache(DEDUP_CACHE_MAX_ENTRIES, DEDUP_CACHE_TTL_SECONDS, DEDUP_CACHE_MAX_BYTES)
 monitor_instances = {}
 main_loop = None
 monitor_tasks = {}
 
-processed_trades = set()
+# 処理済みの address:tx_hash（溢れた分はDBの存在チェックで重複判定する）
+processed_trades = BoundedDedupCache(DEDUP_CACHE_MAX_ENTRIES, DEDUP_CACHE_TTL_SECONDS, DEDUP_CACHE_MAX_BYTES)
 startup_grace_period = {}
-
-original_signal = signal.signal
-
-def patched_signal(sig, handler):
-    """スレッド内でのシグナル設定を無効化"""
-    if threading.current_thread() != threading.main_thread():
-        # メインスレッド以外では何もしない
-        return None
-    return original_signal(sig, handler)
-
-signal.signal = patched_signal
+# ワーカーモードでの (ワーカー番号, ワーカー数)
+worker_assignment = None
 
 def touch_healthcheck_file():
     """ヘルスチェックファイルをtouch"""
@@ -56,75 +211,906 @@ def touch_healthcheck_file():
         with open(HEALTHCHECK_FILE, 'a'):
             os.utime(HEALTHCHECK_FILE, None)
     except Exception as e:
-        sys.stderr.write(f"Failed to touch healthcheck file: {e}\n")
+        logger.warning("Failed to touch healthcheck file: %s", e)
 
-def send_to_discord(webhook_url: str, message: str):
-    payload = {
-        "content": message,
-        "username": "Hyperliquid Trade Monitor"
+class Metrics:
+    """Prometheus形式で出力する軽量メトリクス（ホットパスはdictの加算のみ）"""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        with self._lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name: str, seconds: float, labels: tuple = ()):
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def add_collector(self, collector):
+        """スクレイプ時にのみ呼ばれる (name, labels, value) を返すゲージ収集関数を登録"""
+        self.collectors.append(collector)
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = list(self.counters.items())
+            histograms = [(key, list(values)) for key, values in self.histograms.items()]
+        for (name, labels), value in sorted(counters):
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), values in sorted(histograms):
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {values[-1]}")
+        for collector in self.collectors:
+            try:
+                for name, labels, value in collector():
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def observe_latency(metric_name: str):
+    """関数の実行時間をヒストグラムに記録するデコレーター"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(metric_name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+class JsonLogFormatter(logging.Formatter):
+    """1行1レコードのJSONで出力"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        address = getattr(record, 'address', None)
+        if address:
+            entry['address'] = address
+        repeated = getattr(record, 'repeated', 0)
+        if repeated:
+            entry['repeated'] = repeated
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextLogFormatter(logging.Formatter):
+    """従来のprint出力に近いテキスト形式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        address = getattr(record, 'address', None)
+        if address:
+            line = f"[{address[-8:]}] {line}"
+        repeated = getattr(record, 'repeated', 0)
+        if repeated:
+            line += f" (repeated {repeated} times)"
+        return line
+
+def parse_address_log_levels(value: str) -> dict:
+    """ADDRESS_LOG_LEVELSを {アドレス(小文字): レベル} に変換"""
+    levels = {}
+    for item in value.split(','):
+        address, _, level = item.strip().partition('=')
+        if address and level:
+            levels[address.lower()] = logging.getLevelName(level.strip().upper())
+    return {address: level for address, level in levels.items() if isinstance(level, int)}
+
+class AddressLevelFilter(logging.Filter):
+    """アドレス毎のログレベルで絞り込む（アドレスのないログはLOG_LEVELのみ）"""
+
+    def __init__(self, default_level: int, address_levels: dict):
+        super().__init__()
+        self.default_level = default_level
+        self.address_levels = address_levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        address = getattr(record, 'address', None)
+        level = self.address_levels.get(address.lower(), self.default_level) if address else self.default_level
+        return record.levelno >= level
+
+class RepeatRateLimitFilter(logging.Filter):
+    """同じメッセージ（本文とアドレスが同じ）をinterval秒に1回に制限し、抑制した件数を次の出力に付ける"""
+
+    def __init__(self, interval: float, max_keys: int = 10000):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+        key = (record.getMessage(), getattr(record, 'address', None))
+        now = record.created
+        with self._lock:
+            entry = self._last.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                metrics.inc('hl_log_records_suppressed_total')
+                return False
+            record.repeated = entry[1] if entry is not None else 0
+            self._last[key] = [now, 0]
+            self._last.move_to_end(key)
+            if len(self._last) > self.max_keys:
+                self._last.popitem(last=False)
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """キューが満杯の場合はブロックせずに破棄する"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('hl_log_records_dropped_total')
+
+log_listener = None
+
+def setup_logging():
+    """ログをキュー経由でバックグラウンドスレッドから出力する（ホットパスはキューへの追加のみ）"""
+    global log_listener
+    if log_listener is not None:
+        return
+    default_level = logging.getLevelName(LOG_LEVEL)
+    if not isinstance(default_level, int):
+        default_level = logging.INFO
+    address_levels = parse_address_log_levels(ADDRESS_LOG_LEVELS)
+    # 最も詳細なレベルでロガーを開き、実際の判定はフィルターで行う
+    logger.setLevel(min([default_level] + list(address_levels.values())))
+    logger.propagate = False
+
+    if LOG_FORMAT == 'text':
+        formatter = TextLogFormatter("%(asctime)s %(levelname)s %(message)s")
+    else:
+        formatter = JsonLogFormatter()
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.addFilter(lambda record: record.levelno < logging.WARNING)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setLevel(logging.WARNING)
+    for handler in (stdout_handler, stderr_handler):
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(AddressLevelFilter(default_level, address_levels))
+    queue_handler.addFilter(RepeatRateLimitFilter(LOG_REPEAT_INTERVAL))
+    logger.handlers = [queue_handler]
+
+    log_listener = logging.handlers.QueueListener(queue_handler.queue, stdout_handler, stderr_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """キューに残ったログを書き出してリスナーを停止"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+# パス -> クエリ(dict)を受け取り (Content-Type, 本文) を返す関数（コルーチンも可）
+http_routes = {
+    '/metrics': lambda query: ("text/plain; version=0.0.4", metrics.render()),
+}
+
+async def handle_http_request(reader, writer):
+    """GETのみの最小HTTPハンドラー（http_routesのパスを返す）"""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        url = urlsplit(parts[1]) if len(parts) >= 2 and parts[0] == "GET" else None
+        route = http_routes.get(url.path) if url else None
+        if route is None:
+            status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+        else:
+            status = "200 OK"
+            try:
+                result = route(dict(parse_qsl(url.query)))
+                if asyncio.iscoroutine(result):
+                    result = await result
+                content_type, body = result
+            except ValueError as e:
+                status, content_type, body = "400 Bad Request", "text/plain", f"{e}\n"
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.warning("HTTP request failed: %s", e)
+    finally:
+        writer.close()
+
+async def start_http_server():
+    server = await asyncio.start_server(handle_http_request, METRICS_HOST, METRICS_PORT)
+    logger.info("HTTP endpoint listening on http://%s:%s (%s)", METRICS_HOST, METRICS_PORT, ", ".join(http_routes))
+    return server
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+class NotificationSink(ABC):
+    """通知先の基底クラス。シンク毎に専用のキューとワーカースレッドを持ち、遅いシンクが他を止めない
+
+    通常レーンと優先レーンは別々のキューとスレッドで処理するため、
+    優先レーンの通知は通常レーンの送信待ちやリトライの後ろに並ばない
+    """
+
+    kind = "sink"
+    LANES = ('normal', 'priority')
+
+    def __init__(self, name: str):
+        self.name = name
+        # キューには (積んだ時刻, 通知) を入れる
+        self.queues = {lane: queue.Queue(maxsize=DISCORD_QUEUE_SIZE) for lane in self.LANES}
+        self._stop_event = threading.Event()
+        self.workers = [
+            threading.Thread(target=self._run, args=(lane,), name=f"sink-{name}-{lane}", daemon=True)
+            for lane in self.LANES
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def enqueue(self, notification: dict, priority: bool = False):
+        lane = 'priority' if priority else 'normal'
+        if self._stop_event.is_set():
+            # 停止後に積まれた通知は送信されないため、黙って捨てずに数える
+            metrics.inc('hl_sink_errors_total', (('sink', self.name), ('reason', 'stopped')))
+            logger.warning("[%s] Sink is stopped, dropping message", self.name)
+            return
+        try:
+            self.queues[lane].put_nowait((time.perf_counter(), notification))
+        except queue.Full:
+            metrics.inc('hl_sink_errors_total', (('sink', self.name), ('reason', 'queue_full')))
+            logger.warning("[%s] Notification queue (%s) is full (%d), dropping message", self.name, lane, DISCORD_QUEUE_SIZE)
+
+    def _collect_batch(self, lane_queue: queue.Queue, first: tuple) -> list:
+        return [first]
+
+    @abstractmethod
+    def deliver(self, batch: list) -> bool:
+        """バッチを送信し、成功したらTrueを返す"""
+
+    def _run(self, lane: str):
+        lane_queue = self.queues[lane]
+        while not (self._stop_event.is_set() and lane_queue.empty()):
+            try:
+                first = lane_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            batch = self._collect_batch(lane_queue, first)
+            try:
+                if self.deliver([notification for _, notification in batch]):
+                    metrics.inc('hl_sink_messages_sent_total', (('sink', self.name),), len(batch))
+                    sent_at = time.perf_counter()
+                    for enqueued_at, _ in batch:
+                        metrics.observe('hl_sink_delivery_seconds', sent_at - enqueued_at, (('sink', self.name), ('lane', lane)))
+            except Exception as e:
+                metrics.inc('hl_sink_errors_total', (('sink', self.name), ('reason', 'exception')))
+                logger.error("[%s] Failed to deliver notification: %s", self.name, e)
+            for _ in batch:
+                lane_queue.task_done()
+
+    def stop(self, timeout: float = 10):
+        """キューに残っているメッセージを送信してからワーカーを停止"""
+        self._stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout)
+
+class DiscordSink(NotificationSink):
+    """Discord Webhookへの送信（レート制限を見ながら送信する）"""
+
+    kind = "discord"
+
+    def __init__(self, name: str, webhook_url: str):
+        self.webhook_url = webhook_url
+        self.session = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(self.LANES)))
+        self.session.headers.update({"Content-Type": "application/json"})
+        # X-RateLimit-* ヘッダーから読み取った残り回数とリセット時刻
+        self.rate_limit_remaining = None
+        self.rate_limit_reset_at = 0.0
+        super().__init__(name)
+
+    def _rate_limit_close(self) -> bool:
+        return (
+            self.rate_limit_remaining is not None
+            and self.rate_limit_remaining <= 1
+            and time.time() < self.rate_limit_reset_at
+        )
+
+    def _collect_batch(self, lane_queue: queue.Queue, first: tuple) -> list:
+        """レート制限が近い場合、キュー内のメッセージを2000文字以内で1回の送信にまとめる"""
+        batch = [first]
+        if not self._rate_limit_close():
+            return batch
+        length = len(first[1]['message'])
+        while True:
+            try:
+                message = lane_queue.queue[0][1]['message']
+            except IndexError:
+                break
+            if length + 1 + len(message) > DISCORD_MESSAGE_LIMIT:
+                break
+            batch.append(lane_queue.get_nowait())
+            length += 1 + len(message)
+        if len(batch) > 1:
+            logger.info("[%s] Discord rate limit close, sending %d messages in one request", self.name, len(batch))
+        return batch
+
+    def _update_rate_limit(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_after = response.headers.get("X-RateLimit-Reset-After")
+        if remaining is not None:
+            self.rate_limit_remaining = int(remaining)
+        if reset_after is not None:
+            self.rate_limit_reset_at = time.time() + float(reset_after)
+
+    def _wait_for_rate_limit(self):
+        if self.rate_limit_remaining == 0:
+            delay = self.rate_limit_reset_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    def deliver(self, batch: list) -> bool:
+        return self._post("\n".join(notification['message'] for notification in batch))
+
+    def _post(self, content: str) -> bool:
+        """1回分の送信。失敗時はバックオフしながらリトライする"""
+        payload = {
+            "content": content,
+            "username": "Hyperliquid Trade Monitor"
+        }
+        backoff = 1.0
+        for attempt in range(1, DISCORD_MAX_RETRIES + 1):
+            self._wait_for_rate_limit()
+            started = time.perf_counter()
+            try:
+                response = self.session.post(
+                    self.webhook_url,
+                    data=json.dumps(payload),
+                    timeout=DISCORD_REQUEST_TIMEOUT
+                )
+                metrics.observe('hl_discord_send_seconds', time.perf_counter() - started)
+                self._update_rate_limit(response)
+                if response.status_code == 429:
+                    metrics.inc('hl_discord_errors_total', (('reason', 'rate_limited'),))
+                    retry_after = float(response.headers.get("Retry-After", backoff))
+                    logger.warning("Discord rate limited, retrying after %ss (attempt %d/%d)", retry_after, attempt, DISCORD_MAX_RETRIES)
+                    time.sleep(retry_after)
+                    continue
+                if 400 <= response.status_code < 500:
+                    # リトライしても成功しないクライアントエラー
+                    metrics.inc('hl_discord_errors_total', (('reason', 'client_error'),))
+                    logger.error("Failed to send message to Discord: HTTP %s %s", response.status_code, response.text[:200])
+                    return False
+                response.raise_for_status()
+                return True
+            except requests.exceptions.RequestException as e:
+                metrics.inc('hl_discord_errors_total', (('reason', 'request_error'),))
+                logger.warning("Failed to send message to Discord: %s (attempt %d/%d)", e, attempt, DISCORD_MAX_RETRIES)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        metrics.inc('hl_discord_errors_total', (('reason', 'dropped'),))
+        logger.error("Giving up on Discord message after %d attempts", DISCORD_MAX_RETRIES)
+        return False
+
+class HttpSink(NotificationSink):
+    """任意のHTTPエンドポイントに通知をJSONでPOSTする"""
+
+    kind = "http"
+
+    def __init__(self, name: str, url: str, headers: dict = None):
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", **(headers or {})})
+        super().__init__(name)
+
+    def deliver(self, batch: list) -> bool:
+        body = json.dumps(batch[0])
+        backoff = 1.0
+        for attempt in range(1, DISCORD_MAX_RETRIES + 1):
+            try:
+                response = self.session.post(self.url, data=body, timeout=DISCORD_REQUEST_TIMEOUT)
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()
+                    return True
+                logger.warning("[%s] HTTP %s (attempt %d/%d)", self.name, response.status_code, attempt, DISCORD_MAX_RETRIES)
+            except requests.exceptions.HTTPError as e:
+                metrics.inc('hl_sink_errors_total', (('sink', self.name), ('reason', 'client_error')))
+                logger.error("[%s] Failed to send notification: %s", self.name, e)
+                return False
+            except requests.exceptions.RequestException as e:
+                logger.warning("[%s] Failed to send notification: %s (attempt %d/%d)", self.name, e, attempt, DISCORD_MAX_RETRIES)
+            metrics.inc('hl_sink_errors_total', (('sink', self.name), ('reason', 'retry')))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        metrics.inc('hl_sink_errors_total', (('sink', self.name), ('reason', 'dropped')))
+        return False
+
+class FileSink(NotificationSink):
+    """通知をJSON Linesでファイルに追記する"""
+
+    kind = "file"
+
+    def __init__(self, name: str, path: str):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self._write_lock = threading.Lock()
+        super().__init__(name)
+
+    def _collect_batch(self, lane_queue: queue.Queue, first: tuple) -> list:
+        batch = [first]
+        while len(batch) < 100:
+            try:
+                batch.append(lane_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def deliver(self, batch: list) -> bool:
+        data = "".join(json.dumps(notification, ensure_ascii=False) + "\n" for notification in batch)
+        with self._write_lock:
+            self.file.write(data)
+            self.file.flush()
+        return True
+
+    def stop(self, timeout: float = 10):
+        super().stop(timeout)
+        self.file.close()
+
+class StdoutSink(FileSink):
+    """通知をJSON Linesで標準出力に書き出す"""
+
+    kind = "stdout"
+
+    def __init__(self, name: str):
+        self.path = None
+        self.file = sys.stdout
+        self._write_lock = threading.Lock()
+        NotificationSink.__init__(self, name)
+
+    def stop(self, timeout: float = 10):
+        NotificationSink.stop(self, timeout)
+
+SINK_TYPES = {
+    'discord': lambda name, options: DiscordSink(name, options['url']),
+    'http': lambda name, options: HttpSink(name, options['url'], options.get('headers')),
+    'file': lambda name, options: FileSink(name, options['path']),
+    'stdout': lambda name, options: StdoutSink(name),
+}
+
+class NotificationRouter:
+    """アドレス・コイン毎の通知先を事前に展開したテーブルで引く（1トレードあたり最大3回のdict参照）"""
+
+    def __init__(self, sinks: dict, table: dict, default: tuple):
+        self.sinks = sinks
+        self.table = table
+        self.default = default
+
+    @classmethod
+    def from_config(cls, path: str, default_webhook_url: str) -> 'NotificationRouter':
+        """設定ファイル（JSON）から作成。設定がなければDISCORD_WEBHOOK_URLのみに送る"""
+        if not path:
+            sink = DiscordSink('discord', default_webhook_url)
+            return cls({'discord': sink}, {}, (sink,))
+
+        with open(path) as f:
+            config = json.load(f)
+        sinks = {}
+        for name, options in config.get('sinks', {}).items():
+            sink_type = options.get('type')
+            if sink_type not in SINK_TYPES:
+                raise ValueError(f"Unknown sink type for '{name}': {sink_type}")
+            sinks[name] = SINK_TYPES[sink_type](name, options)
+        if 'discord' not in sinks and default_webhook_url:
+            sinks['discord'] = DiscordSink('discord', default_webhook_url)
+
+        def resolve(names):
+            missing = [name for name in names if name not in sinks]
+            if missing:
+                raise ValueError(f"Unknown sink(s) in routing rules: {', '.join(missing)}")
+            return tuple(sinks[name] for name in names)
+
+        # (address, coin) / (address, None) / (None, coin) をキーにしたテーブルに展開する
+        table = {}
+        for route in config.get('routes', []):
+            address = route.get('address')
+            key = (address.lower() if address else None, route.get('coin'))
+            table[key] = resolve(route['sinks'])
+        default = resolve(config.get('default', ['discord']))
+        return cls(sinks, table, default)
+
+    def route(self, address: str, coin: str) -> tuple:
+        address = address.lower()
+        table = self.table
+        return (
+            table.get((address, coin))
+            or table.get((address, None))
+            or table.get((None, coin))
+            or self.default
+        )
+
+    def stop(self):
+        for sink in self.sinks.values():
+            sink.stop()
+
+notification_router = None
+notification_router_lock = threading.Lock()
+
+def init_notification_router(webhook_url: str) -> NotificationRouter:
+    global notification_router
+    with notification_router_lock:
+        if notification_router is None:
+            notification_router = NotificationRouter.from_config(NOTIFICATION_ROUTES_FILE, webhook_url)
+        return notification_router
+
+def stop_delivery_queues():
+    if notification_router is not None:
+        notification_router.stop()
+
+def build_notification(trade: Trade, message: str, **extra) -> dict:
+    """シンクに渡す通知（Discord以外のシンクは構造化データとして使う）"""
+    return {
+        'time': trade.timestamp.isoformat(),
+        'address': trade.address,
+        'coin': trade.coin,
+        'direction': trade.direction,
+        'side': trade.side,
+        'size': trade.size,
+        'price': trade.price,
+        'closed_pnl': trade.closed_pnl,
+        'tx_hash': trade.tx_hash,
+        'message': message,
+        **extra,
     }
-    headers = {
-        "Content-Type": "application/json"
+
+def dispatch_notification(webhook_url: str, trade: Trade, message: str, priority: bool = False, **extra):
+    """ルーティングに従って各シンクのキューに積む（即座に戻る）"""
+    router = notification_router or init_notification_router(webhook_url)
+    notification = build_notification(trade, message, **extra)
+    for sink in router.route(trade.address, trade.coin):
+        sink.enqueue(notification, priority)
+
+def is_priority_trade(trade: Trade) -> bool:
+    """優先レーンで送るトレードか（大口・大きな損益・指定コイン）"""
+    if trade.coin in PRIORITY_COINS:
+        return True
+    if PRIORITY_MIN_NOTIONAL and trade.size * trade.price >= PRIORITY_MIN_NOTIONAL:
+        return True
+    if PRIORITY_MIN_PNL and trade.closed_pnl and abs(trade.closed_pnl) >= PRIORITY_MIN_PNL:
+        return True
+    return False
+
+def send_to_discord(webhook_url: str, message: str):
+    """デフォルトのDiscordシンクのキューに積むだけで即座に戻る"""
+    router = notification_router or init_notification_router(webhook_url)
+    router.sinks['discord'].enqueue({'message': message})
+
+class TradeAggregator:
+    """(address, coin, direction) 毎に一定時間fillをまとめ、合計サイズ・VWAP・PnL合計で1件の通知にする"""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def add(self, webhook_url: str, trade: Trade):
+        key = (trade.address, trade.coin, trade.direction)
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = {
+                    'webhook_url': webhook_url,
+                    'flush_at': time.monotonic() + self.window_seconds,
+                    'first': trade,
+                    'last': trade,
+                    'count': 0,
+                    'size': 0.0,
+                    'notional': 0.0,
+                    'closed_pnl': 0.0,
+                    'tx_hashes': set(),
+                }
+            bucket['last'] = trade
+            bucket['count'] += 1
+            bucket['size'] += trade.size
+            bucket['notional'] += trade.size * trade.price
+            bucket['closed_pnl'] += trade.closed_pnl or 0.0
+            bucket['tx_hashes'].add(trade.tx_hash)
+
+    def flush_due(self, flush_all: bool = False):
+        """期限を過ぎたバケットを通知する"""
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key, bucket in self.buckets.items() if flush_all or bucket['flush_at'] <= now]
+            buckets = [(key, self.buckets.pop(key)) for key in due]
+        for key, bucket in buckets:
+            first = bucket['first']
+            logger.info("Sending aggregated notification for %d %s %s fills", bucket['count'], first.coin, first.direction, extra={'address': first.address})
+            dispatch_notification(
+                bucket['webhook_url'], first, format_aggregate_message(bucket),
+                aggregated_fills=bucket['count'], total_size=bucket['size'], total_closed_pnl=bucket['closed_pnl']
+            )
+            last_notification_time[key] = time.time()
+
+def format_aggregate_message(bucket: dict) -> str:
+    first = bucket['first']
+    vwap = bucket['notional'] / bucket['size'] if bucket['size'] else first.price
+    timestamp = bucket['last'].timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    discord_msg = f"""**[{timestamp}] New {first.trade_type} x{bucket['count']}**
+Address: https://hypurrscan.io/address/{first.address}
+Trade Tx hash: https://hypurrscan.io/tx/{first.tx_hash}
+```
+Coin: {first.coin}
+Total Size: {bucket['size']:g}
+VWAP Price: {vwap:.6g}
+Direction: {first.direction}"""
+    if bucket['closed_pnl']:
+        pnl_emoji = "🟢" if bucket['closed_pnl'] > 0 else "🔴"
+        discord_msg += f"\nPnL: {pnl_emoji} {bucket['closed_pnl']:.2f}"
+    discord_msg += f"\nFills: {bucket['count']} ({len(bucket['tx_hashes'])} tx)"
+    discord_msg += f"\nHash: {first.tx_hash}\n```"
+    return discord_msg
+
+async def run_aggregation_flusher():
+    while True:
+        await asyncio.sleep(min(0.25, AGGREGATION_WINDOW_SECONDS))
+        trade_aggregator.flush_due()
+
+trade_aggregator = TradeAggregator(AGGREGATION_WINDOW_SECONDS) if AGGREGATION_WINDOW_SECONDS > 0 else None
+
+class TradeDigests:
+    """アドレス毎・期間毎の損益・出来高・勝率・最大トレードを逐次集計する（DBは再集計しない）"""
+
+    INTERVALS = {
+        'hourly': ('Hourly', lambda moment: moment.replace(minute=0, second=0, microsecond=0), 3600),
+        'daily': ('Daily', lambda moment: moment.replace(hour=0, minute=0, second=0, microsecond=0), 86400),
     }
-    try:
-        response = requests.post(
-            webhook_url,
-            data=json.dumps(payload),
-            headers=headers
+    # 期間終了後も遅れて届くfillを待ってから送信する秒数
+    GRACE_SECONDS = 60
+
+    def __init__(self, intervals: list):
+        unknown = [name for name in intervals if name not in self.INTERVALS]
+        if unknown:
+            raise ValueError(f"Unknown DIGEST_INTERVALS: {', '.join(unknown)}")
+        self.intervals = intervals
+        # (interval, address, 期間開始) -> 集計中のバケット。期間はトレードの約定時刻で決める
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def period_start(self, interval: str, moment: float) -> float:
+        return self.INTERVALS[interval][1](datetime.fromtimestamp(moment)).timestamp()
+
+    def record(self, trade: Trade):
+        executed_at = trade.timestamp.timestamp()
+        notional = trade.size * trade.price
+        pnl = trade.closed_pnl or 0.0
+        with self._lock:
+            for interval in self.intervals:
+                start = self.period_start(interval, executed_at)
+                key = (interval, trade.address, start)
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = {
+                        'interval': interval, 'address': trade.address, 'start': start,
+                        'trades': 0, 'pnl': 0.0, 'wins': 0, 'losses': 0, 'volume': {}, 'biggest': None,
+                    }
+                bucket['trades'] += 1
+                bucket['pnl'] += pnl
+                if pnl > 0:
+                    bucket['wins'] += 1
+                elif pnl < 0:
+                    bucket['losses'] += 1
+                bucket['volume'][trade.coin] = bucket['volume'].get(trade.coin, 0.0) + notional
+                biggest = bucket['biggest']
+                if biggest is None or notional > biggest['notional']:
+                    bucket['biggest'] = {
+                        'notional': notional, 'coin': trade.coin, 'direction': trade.direction,
+                        'size': trade.size, 'price': trade.price, 'tx_hash': trade.tx_hash,
+                    }
+
+    def take_due(self, now: float = None) -> dict:
+        """期間が終わったバケットを取り出して (interval, 期間開始) -> [bucket] で返す"""
+        now = now or time.time()
+        due = defaultdict(list)
+        with self._lock:
+            for key, bucket in list(self.buckets.items()):
+                interval, _, start = key
+                if start + self.INTERVALS[interval][2] + self.GRACE_SECONDS <= now:
+                    due[(interval, start)].append(bucket)
+                    del self.buckets[key]
+        return due
+
+    def dump(self) -> list:
+        with self._lock:
+            return list(self.buckets.values())
+
+    def load(self, buckets: list):
+        with self._lock:
+            for bucket in buckets:
+                if bucket.get('interval') not in self.intervals:
+                    continue
+                self.buckets[(bucket['interval'], bucket['address'], bucket['start'])] = bucket
+
+def format_digest_lines(bucket: dict) -> str:
+    closes = bucket['wins'] + bucket['losses']
+    win_rate = f"{bucket['wins']}/{closes} ({bucket['wins'] / closes:.0%})" if closes else "-"
+    pnl_emoji = "🟢" if bucket['pnl'] >= 0 else "🔴"
+    volume = sorted(bucket['volume'].items(), key=lambda item: item[1], reverse=True)
+    lines = [
+        bucket['address'],
+        f"  Trades: {bucket['trades']}  PnL: {pnl_emoji} {bucket['pnl']:+.2f}  Win rate: {win_rate}",
+        "  Volume: " + ", ".join(f"{coin} {notional:,.0f}" for coin, notional in volume),
+    ]
+    biggest = bucket['biggest']
+    if biggest:
+        lines.append(
+            f"  Biggest: {biggest['coin']} {biggest['direction']} {biggest['size']:g} @ {biggest['price']:.6g} ({biggest['notional']:,.0f})"
         )
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        sys.stderr.write(f"Failed to send message to Discord: {e}\n")
+    return "\n".join(lines)
+
+def format_digest_messages(interval: str, buckets: list) -> list:
+    """1期間分のダイジェスト。Discordの文字数制限を超える場合のみ複数に分ける"""
+    label, _, seconds = TradeDigests.INTERVALS[interval]
+    start = min(bucket['start'] for bucket in buckets)
+    period = f"{datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M')} - {datetime.fromtimestamp(start + seconds).strftime('%H:%M' if seconds < 86400 else '%Y-%m-%d %H:%M')}"
+    header = f"**[{period}] {label} digest**\n"
+    messages = []
+    body = ""
+    for bucket in sorted(buckets, key=lambda bucket: bucket['pnl'], reverse=True):
+        section = format_digest_lines(bucket) + "\n"
+        if body and len(header) + len(body) + len(section) + 8 > DISCORD_MESSAGE_LIMIT:
+            messages.append(f"{header}```\n{body}```")
+            body = ""
+        body += section
+    if body:
+        messages.append(f"{header}```\n{body}```")
+    return messages
+
+async def run_digest_flusher(webhook_url: str):
+    while True:
+        await asyncio.sleep(30)
+        for (interval, _), buckets in sorted(trade_digests.take_due().items(), key=lambda item: item[0][1]):
+            for message in format_digest_messages(interval, buckets):
+                send_to_discord(webhook_url, message)
+
+trade_digests = TradeDigests(DIGEST_INTERVALS) if DIGEST_INTERVALS else None
 
-def process_trade_with_db(webhook_url: str, trade: Trade, db_path: str):
-    """DBパスを指定してトレードを処理"""
+# 直近に処理したトレード（/trades で参照。インジェストキューのスレッドから追加される）
+recent_trades = deque(maxlen=RECENT_TRADES_SIZE)
+
+def remember_trade(trade: Trade, status: str):
+    """処理結果と一緒にリングバッファへ記録する"""
+    recent_trades.append({
+        'time': trade.timestamp.isoformat(),
+        'address': trade.address,
+        'coin': trade.coin,
+        'direction': trade.direction,
+        'side': trade.side,
+        'size': trade.size,
+        'price': trade.price,
+        'closed_pnl': trade.closed_pnl,
+        'tx_hash': trade.tx_hash,
+        'status': status,
+    })
+
+def fill_key(address: str, tx_hash: str, tid) -> str:
+    """fill単位の重複チェックキー（1つのtxが複数の約定に分かれるためtidも含める）"""
+    return f"{address}:{tx_hash}:{tid}"
+
+@observe_latency('hl_callback_seconds')
+def process_trade_with_db(webhook_url: str, trade: Trade, db_path: str, tid=None, merged: list = ()):
+    """DBパスを指定してトレードを処理（tidはfillの約定ID、mergedは過負荷時にまとめられた後続のトレード）"""
     global trade_cache, processed_trades, startup_grace_period, last_notification_time
 
+    metrics.inc('hl_trades_total', (('address', trade.address),))
+
     # ヘルスチェックファイルを更新
     touch_healthcheck_file()
 
-    address_suffix = trade.address[-8:]
-    trade_key = f"{trade.address}:{trade.tx_hash}"
+    log_extra = {'address': trade.address}
+    trade_key = fill_key(trade.address, trade.tx_hash, tid)
     
     # メモリベースの重複チェック
     if trade_key in processed_trades:
-        print(f"[{address_suffix}] Trade {trade.tx_hash} already processed in memory, skipping")
+        logger.debug("Trade %s already processed in memory, skipping", trade.tx_hash, extra=log_extra)
         return
     
     # 通知を抑制する（起動時の大量通知を防ぐ）
     current_time = time.time()
     address_startup_time = startup_grace_period.get(trade.address)
     
-    if address_startup_time and (current_time - address_startup_time) < 60:
-        print(f"[{address_suffix}] Startup grace period - skipping historical trade: {trade.tx_hash}")
+    if address_startup_time and (current_time - address_startup_time) < STARTUP_GRACE_SECONDS:
+        logger.debug("Startup grace period - skipping historical trade: %s", trade.tx_hash, extra=log_extra)
         processed_trades.add(trade_key)
+        remember_trade(trade, 'grace_period')
         return
     
-    if os.path.exists(db_path) and check_trade_exists_in_db(db_path, trade.tx_hash):
-        print(f"[{address_suffix}] Trade {trade.tx_hash} already exists in DB, skipping notification")
+    if os.path.exists(db_path) and check_trade_exists_in_db(db_path, trade.tx_hash, tid, trade.size, trade.price):
+        logger.debug("Trade %s already exists in DB, skipping notification", trade.tx_hash, extra=log_extra)
+        processed_trades.add(trade_key)
+        remember_trade(trade, 'duplicate')
+        return
+
+    if trade_archive and archive_trade_exists(trade.address, trade.tx_hash, tid):
+        logger.debug("Trade %s already exists in archive, skipping notification", trade.tx_hash, extra=log_extra)
         processed_trades.add(trade_key)
+        remember_trade(trade, 'duplicate')
+        return
+
+    # ダイジェストは通知抑制・集約の対象になったトレードも含めて集計する
+    if trade_digests:
+        trade_digests.record(trade)
+
+    # 優先トレードは集約・通知抑制をせずに優先レーンで即座に送る
+    priority = is_priority_trade(trade)
+    if priority:
+        metrics.inc('hl_priority_trades_total')
+
+    # 集約モードでは抑制せずにバッファへ積み、ウィンドウ終了時にまとめて通知する
+    if trade_aggregator and not priority:
+        processed_trades.add(trade_key)
+        remember_trade(trade, 'aggregated')
+        trade_aggregator.add(webhook_url, trade)
         return
 
     # 通知抑制ロジック
     suppression_key = (trade.address, trade.coin, trade.direction)
     last_time = last_notification_time.get(suppression_key)
 
-    if last_time and (current_time - last_time) < NOTIFICATION_SUPPRESSION_SECONDS:
-        print(f"[{address_suffix}] Notification for {trade.coin} {trade.direction} suppressed. Last notification was at {datetime.fromtimestamp(last_time).strftime('%Y-%m-%d %H:%M:%S')}")
+    if not priority and last_time and (current_time - last_time) < NOTIFICATION_SUPPRESSION_SECONDS:
+        logger.debug("Notification for %s %s suppressed. Last notification was %.0fs ago", trade.coin, trade.direction, current_time - last_time, extra=log_extra)
         processed_trades.add(trade_key)
+        remember_trade(trade, 'suppressed')
         return
 
     # 新しいトレードとして処理
     processed_trades.add(trade_key)
     
-    trade_cache[trade.tx_hash].append(trade)
-    trades = trade_cache[trade.tx_hash]
-    total_size = sum(t.size for t in trades)
+    is_first_fill = trade_cache.add(trade.tx_hash)
+    remember_trade(trade, ('priority' if priority else 'notified') if is_first_fill else 'same_tx')
     timestamp = trade.timestamp.strftime('%Y-%m-%d %H:%M:%S')
 
     discord_msg = ""
 
-    if len(trades) == 1:
+    if is_first_fill:
         discord_msg = f"""**[{timestamp}] New {trade.trade_type}**
 Address: https://hypurrscan.io/address/{trade.address}
 Trade Tx hash: https://hypurrscan.io/tx/{trade.tx_hash}
@@ -138,66 +1124,307 @@ Price: {trade.price}"""
         if trade.closed_pnl:
             pnl_emoji = "🟢" if trade.closed_pnl > 0 else "🔴"
             discord_msg += f"\nPnL: {pnl_emoji} {trade.closed_pnl:.2f}"
+
+        extra = {}
+        if merged:
+            # まとめられたfillは個別に通知しないため、件数と合計サイズをこの通知に載せる
+            extra = {'coalesced_fills': len(merged), 'total_size': trade.size + sum(other.size for other in merged)}
+            discord_msg += f"\nCoalesced: {len(merged) + 1} fills, total size {extra['total_size']:g}"
         
         discord_msg += f"\nHash: {trade.tx_hash}\n```"
 
         if discord_msg:
-            print(f"[{address_suffix}] Sending Discord notification for new trade: {trade.tx_hash}")
-            send_to_discord(webhook_url, discord_msg)
+            logger.info("Sending notification for new trade: %s", trade.tx_hash, extra=log_extra)
+            dispatch_notification(webhook_url, trade, discord_msg, priority, **extra)
             # 通知を送信したら、時刻を更新
             last_notification_time[suppression_key] = current_time
 
-def check_trade_exists_in_db(db_path: str, tx_hash: str) -> bool:
-    """DBに指定されたtx_hashのトレードが既に存在するかチェック"""
-    import sqlite3
+class TradeLookupPool:
+    """DB毎に接続をキャッシュしてfillの存在チェックを行う（コールバックスレッド間で共有）"""
+
+    # TradeDatabase.store_fill が書き込むfillsテーブルにはtid列がないため、
+    # 同じtx内の約定を区別できるよう (tx_hash, tid) を別テーブルに記録する
+    TID_SCHEMA = "CREATE TABLE IF NOT EXISTS fill_tids (tx_hash TEXT NOT NULL, tid INTEGER NOT NULL, PRIMARY KEY (tx_hash, tid)) WITHOUT ROWID"
+    INSERT_TID_QUERY = "INSERT OR IGNORE INTO fill_tids (tx_hash, tid) VALUES (?, ?)"
+    # 同じSQL文字列はsqlite3のステートメントキャッシュで再利用される
+    EXISTS_QUERY = "SELECT 1 FROM fill_tids WHERE tx_hash = ? AND tid = ? LIMIT 1"
+    # tidのないfillはサイズと価格で区別する
+    EXISTS_WITHOUT_TID_QUERY = "SELECT 1 FROM fills WHERE tx_hash = ? AND size = ? AND price = ? LIMIT 1"
+    SCHEMA_RECHECK_SECONDS = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _get_entry(self, db_path: str) -> dict:
+        with self._lock:
+            entry = self._entries.get(db_path)
+            if entry is None:
+                # mode=rwで開き、存在しないDBファイルを作らない
+                conn = sqlite3.connect(f"file:{db_path}?mode=rw", uri=True, check_same_thread=False)
+                entry = {'conn': conn, 'lock': threading.Lock(), 'ready': False, 'checked_at': 0.0}
+                self._entries[db_path] = entry
+            return entry
+
+    def _check_schema(self, entry: dict) -> bool:
+        """fillsテーブルとtx_hash列を確認し、インデックスとtidのテーブルを作成する"""
+        conn = entry['conn']
+        entry['checked_at'] = time.time()
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(fills)")]
+        if 'tx_hash' not in columns:
+            return False
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fills_tx_hash ON fills(tx_hash)")
+        conn.execute(self.TID_SCHEMA)
+        conn.commit()
+        entry['ready'] = True
+        return True
+
+    def exists(self, db_path: str, tx_hash: str, tid, size: float, price: float) -> bool:
+        entry = self._get_entry(db_path)
+        with entry['lock']:
+            if not entry['ready']:
+                if time.time() - entry['checked_at'] < self.SCHEMA_RECHECK_SECONDS:
+                    return False
+                if not self._check_schema(entry):
+                    return False
+            if tid is None:
+                return entry['conn'].execute(self.EXISTS_WITHOUT_TID_QUERY, (tx_hash, size, price)).fetchone() is not None
+            return entry['conn'].execute(self.EXISTS_QUERY, (tx_hash, tid)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            for entry in self._entries.values():
+                with entry['lock']:
+                    entry['conn'].close()
+            self._entries.clear()
+
+trade_lookup_pool = TradeLookupPool()
+
+@observe_latency('hl_sqlite_lookup_seconds')
+def check_trade_exists_in_db(db_path: str, tx_hash: str, tid, size: float, price: float) -> bool:
+    """DBに指定されたfillが既に存在するかチェック"""
     try:
         # DBファイルが存在しない場合は存在しないと判定
         if not os.path.exists(db_path):
             return False
-            
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # テーブルの存在確認
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='trades'
-        """)
-        
-        if not cursor.fetchone():
-            conn.close()
-            return False  # ログ出力を削除（起動時の大量出力を防ぐ）
-        
-        # tx_hash列の存在確認
-        cursor.execute("PRAGMA table_info(trades)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'tx_hash' not in columns:
-            conn.close()
-            return False
-        
-        # tradesテーブルでtx_hashをチェック
-        cursor.execute("SELECT COUNT(*) FROM trades WHERE tx_hash = ?", (tx_hash,))
-        count = cursor.fetchone()[0]
-        
-        conn.close()
-        return count > 0
-        
+        return trade_lookup_pool.exists(db_path, tx_hash, tid, size, price)
+
     except sqlite3.Error as e:
-        print(f"SQLite error checking trade in DB: {e}")
+        logger.warning("SQLite error checking trade in DB: %s", e)
         return False
     except Exception as e:
-        print(f"Error checking trade in DB: {e}")
+        logger.warning("Error checking trade in DB: %s", e)
         return False
 
-def load_addresses(file_path: str) -> list:
+class TradeArchive:
+    """全アドレス共通のWALモードDB。専用スレッドがfillをまとめて1トランザクションで書き込む"""
+
+    INSERT_QUERY = """
+        INSERT OR IGNORE INTO trades (
+            address, tx_hash, tid, timestamp, coin, side, size, price, direction,
+            fee, fee_token, start_position, closed_pnl
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    EXISTS_QUERY = "SELECT 1 FROM trades WHERE address = ? AND tid = ? LIMIT 1"
+    EXISTS_TX_QUERY = "SELECT 1 FROM trades WHERE address = ? AND tx_hash = ? LIMIT 1"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.queue = queue.Queue()
+        # 書き込み待ちの (address, tid)。存在チェックはDBとこれの両方を見る
+        self.pending = defaultdict(int)
+        self._pending_lock = threading.Lock()
+        self._init_schema()
+        self._read_conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.writer = threading.Thread(target=self._run, name="trade-archive", daemon=True)
+        self.writer.start()
+
+    def _init_schema(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS trades (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                address TEXT NOT NULL,
+                tx_hash TEXT,
+                tid INTEGER,
+                timestamp INTEGER,
+                coin TEXT,
+                side TEXT,
+                size REAL,
+                price REAL,
+                direction TEXT,
+                fee REAL,
+                fee_token TEXT,
+                start_position REAL,
+                closed_pnl REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_address_tx_hash ON trades(address, tx_hash)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_address_timestamp ON trades(address, timestamp)")
+        # 再接続時のスナップショットで同じfillが重複して入らないようにする
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_address_tid ON trades(address, tid)")
+        conn.commit()
+        conn.close()
+
+    def enqueue(self, address: str, fill: dict):
+        tid = fill.get("tid")
+        with self._pending_lock:
+            self.pending[(address, tid)] += 1
+        self.queue.put((
+            address,
+            fill.get("hash"),
+            tid,
+            int(fill.get("time", 0)),
+            fill.get("coin", "Unknown"),
+            "BUY" if fill.get("side", "B") == "A" else "SELL",
+            float(fill.get("sz", 0)),
+            float(fill.get("px", 0)),
+            fill.get("dir"),
+            float(fill.get("fee", 0)),
+            fill.get("feeToken"),
+            float(fill.get("startPosition", 0)),
+            float(fill.get("closedPnl", 0)),
+        ))
+
+    def exists(self, address: str, tid) -> bool:
+        with self._pending_lock:
+            if self.pending.get((address, tid)):
+                return True
+        with self._read_lock:
+            return self._read_conn.execute(self.EXISTS_QUERY, (address, tid)).fetchone() is not None
+
+    def exists_tx(self, address: str, tx_hash: str) -> bool:
+        with self._read_lock:
+            return self._read_conn.execute(self.EXISTS_TX_QUERY, (address, tx_hash)).fetchone() is not None
+
+    def _write_batch(self, conn, rows: list):
+        started = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(self.INSERT_QUERY, rows)
+        except sqlite3.Error as e:
+            metrics.inc('hl_errors_total', (('stage', 'archive'),))
+            logger.error("Failed to write %d trades to archive: %s", len(rows), e)
+        metrics.observe('hl_archive_write_seconds', time.perf_counter() - started)
+        with self._pending_lock:
+            for row in rows:
+                key = (row[0], row[2])
+                self.pending[key] -= 1
+                if self.pending[key] <= 0:
+                    del self.pending[key]
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while not (self._stop_event.is_set() and self.queue.empty()):
+            try:
+                rows = [self.queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            # 少し待って後続のfillも同じトランザクションにまとめる
+            deadline = time.monotonic() + ARCHIVE_FLUSH_INTERVAL
+            while len(rows) < ARCHIVE_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write_batch(conn, rows)
+        conn.close()
+
+    def close(self, timeout: float = 10):
+        """書き込み待ちをすべて書き出してから停止"""
+        self._stop_event.set()
+        self.writer.join(timeout)
+        with self._read_lock:
+            self._read_conn.close()
+
+# 監視プロセスでのみ init_trade_archive() で開く
+trade_archive = None
+
+def init_trade_archive():
+    """共通DBを開いて書き込みスレッドを起動する"""
+    global trade_archive
+    if ARCHIVE_DB_PATH and trade_archive is None:
+        trade_archive = TradeArchive(ARCHIVE_DB_PATH)
+
+@observe_latency('hl_sqlite_lookup_seconds')
+def archive_trade_exists(address: str, tx_hash: str, tid) -> bool:
+    """共通DBに指定されたfillが既に存在するかチェック（tidがなければtx_hashで判定）"""
+    try:
+        if tid is None:
+            return trade_archive.exists_tx(address, tx_hash)
+        return trade_archive.exists(address, tid)
+    except sqlite3.Error as e:
+        logger.warning("SQLite error checking trade in archive: %s", e)
+        return False
+
+def load_trades_from_db(address: str, coin: str, limit: int) -> list:
+    """リングバッファに無い古いトレードをDBから読む（イベントループ外のスレッドで呼ぶ）"""
+    if trade_archive:
+        conditions, params = [], []
+        for column, value in (('address', address), ('coin', coin)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT timestamp, address, coin, direction, side, size, price, closed_pnl, tx_hash
+            FROM trades {where} ORDER BY timestamp DESC LIMIT ?
+        """
+        db_path = trade_archive.db_path
+    elif address:
+        # アドレス毎のDBのaddress列は記録されていないため、引数のアドレスで埋める
+        where = "WHERE coin = ?" if coin else ""
+        params = [address] + ([coin] if coin else [])
+        query = f"""
+            SELECT timestamp, ?, coin, direction, side, size, price, closed_pnl, tx_hash
+            FROM fills {where} ORDER BY id DESC LIMIT ?
+        """
+        db_path = os.path.join(DB_DIRECTORY, f"trades_{address[-8:]}.db")
+    else:
+        return []
+    if not os.path.exists(db_path):
+        return []
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(query, params + [limit]).fetchall()
+    finally:
+        conn.close()
+    trades = []
+    for timestamp, address, coin, direction, side, size, price, closed_pnl, tx_hash in rows:
+        if isinstance(timestamp, int):
+            # 共通DBはミリ秒で保存している
+            timestamp = datetime.fromtimestamp(timestamp / 1000).isoformat()
+        else:
+            timestamp = str(timestamp).replace(' ', 'T', 1)
+        trades.append({
+            'time': timestamp, 'address': address, 'coin': coin, 'direction': direction,
+            'side': side, 'size': size, 'price': price, 'closed_pnl': closed_pnl,
+            'tx_hash': tx_hash, 'status': 'stored',
+        })
+    return trades
+
+def read_addresses(file_path: str) -> list:
+    """アドレスファイルを読み込む（重複は除き、順序は維持）"""
     addresses = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            address = line.strip()
+            if address and address not in addresses:  # Skip empty lines
+                addresses.append(address)
+    return addresses
+
+def load_addresses(file_path: str) -> list:
     try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                address = line.strip()
-                if address:  # Skip empty lines
-                    addresses.append(address)
+        addresses = read_addresses(file_path)
     except IOError as e:
         sys.stderr.write(f"Error reading addresses file: {e}\n")
         sys.exit(1)
@@ -212,197 +1439,1000 @@ def write_pidfile(pidfile):
     try:
         with open(pidfile, 'w') as f:
             f.write(str(os.getpid()))
-        print(f"PID file created: {pidfile}")
+        logger.info("PID file created: %s", pidfile)
     except IOError as e:
-        sys.stderr.write(f"Failed to write pidfile: {e}\n")
+        logger.error("Failed to write pidfile: %s", e)
 
 def remove_pidfile(pidfile):
     try:
         if os.path.exists(pidfile):
             os.remove(pidfile)
-            print(f"PID file removed: {pidfile}")
+            logger.info("PID file removed: %s", pidfile)
     except OSError as e:
-        print(f"Error removing pidfile: {e}")
+        logger.warning("Error removing pidfile: %s", e)
 
-async def monitor_address_async(webhook_url: str, address: str, address_index: int):
-    """非同期で単一アドレスを監視し、切断時に自動再接続する"""
-    global startup_grace_period, monitor_instances
-    
-    db_path = os.path.join(DB_DIRECTORY, f"trades_{address[-8:]}.db")
+# アドレス毎に処理済みの最新fill時刻（ミリ秒）
+fill_watermarks = {}
 
-    # Create a shared state object for communication between threads
-    shared_state = {
-        'last_trade_time': time.time(),
-        'connection_dead': threading.Event()
-    }
+def start_grace_period(address: str):
+    """(再)購読時の猶予期間を開始（状態スナップショット有効時はウォーターマークで判定するため不要）"""
+    if not STATE_SNAPSHOT_PATH:
+        startup_grace_period[address] = time.time()
 
-    def create_callback(addr, db_file):
-        def callback(trade):
-            # Update the timestamp on each new trade
-            shared_state['last_trade_time'] = time.time()
-            return process_trade_with_db(webhook_url, trade, db_file)
-        return callback
+def classify_historical_fills(address: str, fills: list, is_snapshot: bool) -> list:
+    """購読直後のスナップショットのうち、前回までに処理済みのfillをTrueとして返す"""
+    watermark = fill_watermarks.get(address)
+    fill_times = [int(fill.get("time", 0)) for fill in fills]
+    if not STATE_SNAPSHOT_PATH or not is_snapshot:
+        return [False] * len(fills)
+    # ウォーターマークがない（初めて見る）アドレスのスナップショットはすべて履歴扱い
+    return [watermark is None or fill_time <= watermark for fill_time in fill_times]
 
-    # Create the callback once
-    monitor_callback = create_callback(address, db_path)
+def advance_watermark(address: str, fill: dict):
+    """処理を終えたfillまでウォーターマークを進める（受信しただけのfillでは進めない）"""
+    fill_time = int(fill.get("time", 0))
+    if fill_time > fill_watermarks.get(address, 0):
+        fill_watermarks[address] = fill_time
 
-    while True:  # The main reconnection loop
-        monitor = None
-        monitor_thread = None
-        
-        # Reset state for the new connection attempt
-        shared_state['connection_dead'].clear()
-        shared_state['last_trade_time'] = time.time()
+class StateSnapshot:
+    """重複チェック・通知抑制・ウォーターマークをバイナリファイルに保存/復元する
+
+    形式: b"HLMS" + version(1) + JSON長(4) + JSON + processed_tradesのキー(16バイト*n) + trade_cacheのキー(16バイト*m)
+    """
+
+    MAGIC = b"HLMS"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBI")
+
+    def __init__(self, path: str):
+        self.path = path
+        # 定期保存のスレッドがキャンセル後も書き込み中の場合、終了時の保存はその完了を待つ
+        self._save_lock = threading.Lock()
+
+    def save(self):
+        with self._save_lock:
+            self._save()
 
+    def _save(self):
+        processed_keys = processed_trades.dump_keys()
+        trade_cache_keys = trade_cache.dump_keys()
+        meta = json.dumps({
+            'saved_at': time.time(),
+            'processed_trades': len(processed_keys) // 16,
+            'trade_cache': len(trade_cache_keys) // 16,
+            'watermarks': dict(fill_watermarks),
+            'last_notification_time': [[*key, value] for key, value in list(last_notification_time.items())],
+            'digests': trade_digests.dump() if trade_digests else [],
+        }).encode()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(meta)))
+            f.write(meta)
+            f.write(processed_keys)
+            f.write(trade_cache_keys)
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        magic, version, meta_length = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.VERSION:
+            logger.warning("Ignoring state snapshot with unknown format: %s", self.path)
+            return False
+        offset = self.HEADER.size
+        meta = json.loads(data[offset:offset + meta_length])
+        offset += meta_length
+        processed_end = offset + meta['processed_trades'] * 16
+        processed_trades.load_keys(data[offset:processed_end])
+        trade_cache.load_keys(data[processed_end:processed_end + meta['trade_cache'] * 16])
+        fill_watermarks.update(meta['watermarks'])
+        for address, coin, direction, value in meta['last_notification_time']:
+            last_notification_time[(address, coin, direction)] = value
+        if trade_digests:
+            trade_digests.load(meta.get('digests', []))
+        logger.info("Loaded state snapshot from %s: %d processed trades, %d watermarks (saved %.0fs ago)",
+                    self.path, meta['processed_trades'], len(meta['watermarks']), time.time() - meta['saved_at'])
+        return True
+
+async def checkpoint_state(snapshot: StateSnapshot):
+    """定期的に状態スナップショットを書き出す"""
+    while True:
+        await asyncio.sleep(STATE_SNAPSHOT_INTERVAL)
         try:
-            print(f"[{address_index}] Initializing monitor for address: {address}")
-            
-            startup_grace_period[address] = time.time()
-            
-            monitor = HyperliquidMonitor(
-                addresses=[address],
-                db_path=db_path,
-                callback=monitor_callback
-            )
-            monitor_instances[address] = monitor
+            await asyncio.to_thread(snapshot.save)
+        except Exception as e:
+            logger.error("Failed to save state snapshot: %s", e)
 
-            # --- Monkey-patching the send_ping method ---
-            try:
-                def patched_send_ping(ws_manager_instance):
-                    """Patched send_ping that signals when the websocket is closed."""
-                    print(f"[{address_index}] Starting patched ping thread for {address}.")
-                    while not ws_manager_instance.ws.closed and not shared_state['connection_dead'].is_set():
-                        try:
-                            ws_manager_instance.ws.send(json.dumps({"method": "ping"}))
-                            time.sleep(5)
-                        except WebSocketConnectionClosedException:
-                            print(f"[{address_index}] Ping thread: WebSocket connection closed. Signaling for reconnect.")
-                            shared_state['connection_dead'].set()
-                            if monitor:
-                                monitor.stop()
-                            break
-                        except Exception as e:
-                            print(f"[{address_index}] Error in patched ping thread for {address}: {e}. Signaling for reconnect.")
-                            shared_state['connection_dead'].set()
-                            if monitor:
-                                monitor.stop()
-                            break
-                    print(f"[{address_index}] Patched ping thread for {address} terminated.")
-
-                if hasattr(monitor, 'info') and hasattr(monitor.info, 'ws_manager') and hasattr(monitor.info.ws_manager, 'send_ping'):
-                    ws_manager = monitor.info.ws_manager
-                    ws_manager.send_ping = patched_send_ping.__get__(ws_manager)
-                    print(f"[{address_index}] Successfully patched 'send_ping' method.")
-                else:
-                    sys.stderr.write(f"[{address_index}] WARNING: Could not find 'monitor.info.ws_manager.send_ping' method to patch.\n")
-            except Exception as e:
-                sys.stderr.write(f"[{address_index}] WARNING: An error occurred while applying the ping thread patch: {e}\n")
-            
-            error_container = {'error': None}
-            
-            def start_monitor_thread():
-                """A thread to run the blocking monitor.start() call."""
+state_snapshot = StateSnapshot(STATE_SNAPSHOT_PATH) if STATE_SNAPSHOT_PATH else None
+
+def fill_to_trade(fill: dict, address: str) -> Trade:
+    """userFillsのfillをTradeに変換（HyperliquidMonitor._process_fillと同じ変換）"""
+    return hyperliquid_types.Trade(
+        timestamp=datetime.fromtimestamp(int(fill.get("time", 0)) / 1000),
+        address=address,
+        coin=fill.get("coin", "Unknown"),
+        side="BUY" if fill.get("side", "B") == "A" else "SELL",
+        size=float(fill.get("sz", 0)),
+        price=float(fill.get("px", 0)),
+        trade_type="FILL",
+        direction=fill.get("dir"),
+        tx_hash=fill.get("hash"),
+        fee=float(fill.get("fee", 0)),
+        fee_token=fill.get("feeToken"),
+        start_position=float(fill.get("startPosition", 0)),
+        closed_pnl=float(fill.get("closedPnl", 0))
+    )
+
+def split_into_shards(addresses: list, shard_size: int) -> list:
+    """アドレスリストをshard_size件ずつに分割"""
+    return [addresses[i:i + shard_size] for i in range(0, len(addresses), shard_size)]
+
+class ReconnectScheduler:
+    """再接続の待ち時間（指数バックオフ + ジッター）と同時ハンドシェイク数を一元管理する"""
+
+    def __init__(self, base_delay: float, max_delay: float, max_concurrent: int, stable_seconds: float):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrent = max_concurrent
+        self.stable_seconds = stable_seconds
+        self.failures = defaultdict(int)
+        self.connected_at = {}
+        self.disconnected_at = {}
+        self.recovery = {}
+        self._in_flight = 0
+        self._waiters = []
+        self._sequence = 0
+
+    def backoff_delay(self, key: str) -> float:
+        """連続失敗回数に応じた待ち時間（full jitter）"""
+        failures = self.failures[key]
+        if failures == 0:
+            return random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** failures)))
+
+    async def wait_before_reconnect(self, key: str):
+        delay = self.backoff_delay(key)
+        logger.info("[%s] Waiting %.1f seconds before reconnecting (consecutive failures: %d)...", key, delay, self.failures[key])
+        await asyncio.sleep(delay)
+
+    async def _acquire(self, key: str):
+        # 失敗の少ない（健全な）接続から順にハンドシェイク枠を割り当てる
+        if self._in_flight < self.max_concurrent and not self._waiters:
+            self._in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._waiters, (self.failures[key], self._sequence, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # 枠をそのまま待機者に引き継ぐ
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    @asynccontextmanager
+    async def handshake(self, key: str):
+        await self._acquire(key)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def record_connected(self, key: str, addresses: list):
+        now = time.time()
+        self.connected_at[key] = now
+        disconnected_at = self.disconnected_at.pop(key, None)
+        if disconnected_at is None:
+            return
+        recovery_seconds = now - disconnected_at
+        for address in addresses:
+            stats = self.recovery.setdefault(address, {'count': 0, 'last': 0.0, 'max': 0.0, 'total': 0.0})
+            stats['count'] += 1
+            stats['last'] = recovery_seconds
+            stats['max'] = max(stats['max'], recovery_seconds)
+            stats['total'] += recovery_seconds
+        logger.info("[%s] Recovered after %.1f seconds", key, recovery_seconds)
+
+    def record_disconnect(self, key: str):
+        """切断を記録。安定して接続できていた場合は失敗回数をリセットする"""
+        now = time.time()
+        connected_at = self.connected_at.pop(key, None)
+        if connected_at is not None and now - connected_at >= self.stable_seconds:
+            self.failures[key] = 0
+        else:
+            self.failures[key] += 1
+        self.disconnected_at.setdefault(key, now)
+
+    def recovery_stats(self) -> dict:
+        """アドレス毎の復旧時間（秒）の統計"""
+        return {
+            address: {
+                'count': stats['count'],
+                'last': stats['last'],
+                'max': stats['max'],
+                'avg': stats['total'] / stats['count'],
+            }
+            for address, stats in self.recovery.items()
+        }
+
+reconnect_scheduler = ReconnectScheduler(
+    RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, RECONNECT_MAX_CONCURRENT, RECONNECT_STABLE_SECONDS
+)
+
+class IngestQueue:
+    """WebSocketの受信（イベントループ）とトレード処理（専用スレッド）の間の上限付きキュー
+
+    処理が詰まっても受信は止めず、上限に達したらINGEST_OVERLOAD_POLICYに従う:
+    spill    ディスクに退避して後で順番通りに処理する（fillを失わない）
+    coalesce 同じ (address, coin, direction) の処理待ちfillにまとめ、通知は1件にする
+    drop     優先トレード以外を破棄して数える（優先トレードは上限を超えても受け付ける）
+    coalesceでまとめ先がない場合はdropと同じ扱いになる
+    前回の実行で処理されずに残った退避ファイルは、resume_leftover()の後で最初に処理する
+    """
+
+    POLICIES = ('spill', 'coalesce', 'drop')
+
+    def __init__(self, max_size: int, policy: str, spill_path: str):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown INGEST_OVERLOAD_POLICY: {policy}")
+        self.max_size = max_size
+        self.policy = policy
+        self.spill_path = spill_path
+        # 要素は [受信時刻, address, fill, is_historical, まとめたfillのリスト]
+        self.items = deque()
+        self.coalesce_index = {}
+        self.handlers = {}
+        # 処理スレッド専用のアドレス毎のDB
+        self.databases = {}
+        self.spill_file = None
+        self.spilled = 0
+        self.spill_active = False
+        self._cond = threading.Condition()
+        self._stopping = False
+        self.leftover = self._recover_spill()
+        self._replay_leftover = False
+        self._resumed = threading.Event()
+        if not self.leftover:
+            self._resumed.set()
+        self.worker = threading.Thread(target=self._run, name="ingest", daemon=True)
+        self.worker.start()
+
+    def _recover_spill(self) -> list:
+        """前回の退避ファイルを古い順に .recovered.N へ移して返す"""
+        prefix = self.spill_path + ".recovered."
+        directory = os.path.dirname(self.spill_path) or "."
+        recovered = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory)
+             if os.path.join(directory, name).startswith(prefix) and name.rsplit(".", 1)[-1].isdigit()),
+            key=lambda path: int(path.rsplit(".", 1)[-1]),
+        )
+        next_index = int(recovered[-1].rsplit(".", 1)[-1]) + 1 if recovered else 0
+        for path in (self.spill_path + ".draining", self.spill_path):
+            if os.path.exists(path):
+                recovered_path = f"{prefix}{next_index}"
+                next_index += 1
+                os.replace(path, recovered_path)
+                recovered.append(recovered_path)
+        if recovered:
+            logger.warning("Found %d spill file(s) left by a previous run, replaying them after startup", len(recovered))
+        return recovered
+
+    def resume_leftover(self):
+        """ハンドラ登録後に呼ぶ。前回の退避分の処理を始める"""
+        self._replay_leftover = True
+        self._resumed.set()
+
+    def register(self, address: str, handler):
+        self.handlers[address] = handler
+
+    def unregister(self, address: str):
+        self.handlers.pop(address, None)
+
+    def database(self, db_path: str):
+        """アドレス毎のTradeDatabase（処理スレッドからのみ呼ぶ）"""
+        database = self.databases.get(db_path)
+        if database is None:
+            database = self.databases[db_path] = hyperliquid_database.TradeDatabase(db_path)
+            database.conn.execute(TradeLookupPool.TID_SCHEMA)
+        return database
+
+    def store_fill(self, db_path: str, fill: dict):
+        """fillをアドレス毎のDBに保存し、tidも記録する（処理スレッドからのみ呼ぶ）"""
+        database = self.database(db_path)
+        database.store_fill(fill)
+        if fill.get("tid") is not None:
+            database.conn.execute(TradeLookupPool.INSERT_TID_QUERY, (fill.get("hash"), fill["tid"]))
+            database.conn.commit()
+
+    def put(self, address: str, fill: dict, is_historical: bool = False):
+        """受信ループから呼ばれる。ブロックしない"""
+        item = [time.time(), address, fill, is_historical, []]
+        with self._cond:
+            if self.spill_active:
+                self._spill(item)
+                return
+            if len(self.items) < self.max_size:
+                self._append(item)
+                return
+            metrics.inc('hl_ingest_overload_total', (('policy', self.policy),))
+            if self.policy == 'spill':
+                self.spill_active = True
+                self._spill(item)
+                return
+            if self.policy == 'coalesce' and not is_historical:
+                target = self.coalesce_index.get((address, fill.get('coin'), fill.get('dir')))
+                if target is not None:
+                    target[4].append(fill)
+                    metrics.inc('hl_ingest_coalesced_total')
+                    return
+            if not is_historical and is_priority_trade(fill_to_trade(fill, address)):
+                # 優先トレードは上限を超えても受け付ける
+                self._append(item)
+                return
+        metrics.inc('hl_ingest_dropped_total')
+        logger.warning("Ingest queue is full (%d), dropping fill", self.max_size, extra={'address': address})
+
+    def _append(self, item: list):
+        self.items.append(item)
+        if not item[3]:
+            self.coalesce_index[(item[1], item[2].get('coin'), item[2].get('dir'))] = item
+        self._cond.notify()
+
+    def _spill(self, item: list):
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_path, 'a', encoding='utf-8')
+        self.spill_file.write(json.dumps(item[:4]) + "\n")
+        self.spilled += 1
+        metrics.inc('hl_ingest_spilled_total')
+        self._cond.notify()
+
+    def _take_spill(self) -> str:
+        """退避ファイルを処理用に切り離す（以降の退避は新しいファイルに書く）"""
+        self.spill_file.close()
+        self.spill_file = None
+        self.spilled = 0
+        draining_path = self.spill_path + ".draining"
+        os.replace(self.spill_path, draining_path)
+        return draining_path
+
+    def _process(self, item: list):
+        received_at, address, fill, is_historical, coalesced = item
+        metrics.observe('hl_ingest_lag_seconds', time.time() - received_at)
+        handler = self.handlers.get(address)
+        if handler is None:
+            return
+        try:
+            handler(fill, is_historical, merged=coalesced)
+            advance_watermark(address, fill)
+            for extra in coalesced:
+                handler(extra, coalesced=True)
+                advance_watermark(address, extra)
+        except Exception as e:
+            metrics.inc('hl_errors_total', (('stage', 'callback'),))
+            logger.error("Error processing fill: %s", e, extra={'address': address})
+
+    def _drain_spill(self, path: str):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
                 try:
-                    print(f"[{address_index}] Starting monitor.start() for {address} in a new thread.")
-                    monitor.start()
-                except Exception as e:
-                    error_container['error'] = e
-                    sys.stderr.write(f"[{address_index}] Error inside monitor thread for {address}: {e}\n")
-                finally:
-                    print(f"[{address_index}] Monitor thread for {address} has finished.")
-
-            monitor_thread = threading.Thread(target=start_monitor_thread, daemon=True)
-            monitor_thread.start()
-            
-            await asyncio.sleep(2)
-            if error_container['error']:
-                raise error_container['error']
+                    item = json.loads(line) + [[]]
+                except ValueError:
+                    continue
+                self._process(item)
+        os.remove(path)
 
-            print(f"[{address_index}] Monitor for {address} started successfully. Grace period active for 60s.")
-            
-            # Main loop to check thread health and connection status
-            while monitor_thread.is_alive():
-                # Check 1: Signal from the ping thread
-                if shared_state['connection_dead'].is_set():
-                    print(f"[{address_index}] Main loop detected dead connection signal. Breaking to reconnect.")
-                    break
-                
-                # Check 2: Inactivity timeout
-                if (time.time() - shared_state['last_trade_time']) > WEBSOCKET_ACTIVITY_TIMEOUT:
-                    print(f"[{address_index}] No trade activity for over {WEBSOCKET_ACTIVITY_TIMEOUT} seconds. Forcing reconnect.")
-                    shared_state['connection_dead'].set() # Signal other threads
-                    if monitor:
-                        monitor.stop()
+    def _run(self):
+        self._resumed.wait()
+        if self._replay_leftover:
+            for path in self.leftover:
+                self._drain_spill(path)
+                logger.info("Replayed spill file left by a previous run: %s", path)
+        while True:
+            spill_path = None
+            with self._cond:
+                while not self.items and not self.spilled and not self._stopping:
+                    self._cond.wait(1)
+                if self.items:
+                    item = self.items.popleft()
+                    key = (item[1], item[2].get('coin'), item[2].get('dir'))
+                    if self.coalesce_index.get(key) is item:
+                        del self.coalesce_index[key]
+                elif self.spilled:
+                    item = None
+                    spill_path = self._take_spill()
+                else:
                     break
+            if spill_path:
+                self._drain_spill(spill_path)
+                with self._cond:
+                    # 処理中に新たな退避がなければ通常のキューに戻る
+                    if not self.spilled:
+                        self.spill_active = False
+            else:
+                self._process(item)
+        for database in self.databases.values():
+            database.close()
 
-                await asyncio.sleep(10)
-            
-            if error_container['error']:
-                print(f"[{address_index}] Monitor thread for {address} stopped due to an error: {error_container['error']}. Reconnecting...")
+    def stats(self) -> dict:
+        with self._cond:
+            oldest = time.time() - self.items[0][0] if self.items else 0.0
+            return {'depth': len(self.items), 'spilled': self.spilled, 'oldest_seconds': oldest}
+
+    def stop(self, timeout: float = 30):
+        """処理待ち（退避分を含む）を処理してからスレッドを止める"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        # 起動前に止める場合、前回の退避ファイルは次回に持ち越す
+        self._resumed.set()
+        self.worker.join(timeout)
+
+ingest_queue = None
+
+def init_ingest_queue():
+    global ingest_queue
+    if ingest_queue is None:
+        ingest_queue = IngestQueue(
+            INGEST_QUEUE_SIZE,
+            INGEST_OVERLOAD_POLICY,
+            INGEST_SPILL_PATH or os.path.join(DB_DIRECTORY, "ingest_spill.jsonl"),
+        )
+
+class AsyncConnection:
+    """イベントループ上で動く1本のWebSocket接続。複数アドレスのuserFillsを購読してアドレス毎に振り分ける"""
+
+    def __init__(self, name: str):
+        self.name = name
+        # 小文字のアドレス -> 購読時の表記
+        self.addresses = {}
+        self.ws = None
+        # 応答待ちのpingの送信時刻（pongを受け取ったらNone）
+        self.ping_sent_at = None
+        self.missed_pongs = 0
+        self.rtt_history = deque(maxlen=RTT_HISTORY_SIZE)
+
+    def add_address(self, address: str):
+        self.addresses[address.lower()] = address
+
+    async def remove_address(self, address: str):
+        """購読を解除して振り分け先から外す"""
+        self.addresses.pop(address.lower(), None)
+        if self.ws is not None:
+            try:
+                await self._send({"method": "unsubscribe", "subscription": {"type": "userFills", "user": address}})
+            except Exception as e:
+                logger.warning("[%s] Failed to unsubscribe: %s", self.name, e, extra={'address': address})
+
+    async def _send(self, payload: dict):
+        await self.ws.send(json.dumps(payload))
+
+    async def _subscribe(self, address: str):
+        await self._send({"method": "subscribe", "subscription": {"type": "userFills", "user": address}})
+
+    async def _ping_loop(self):
+        """アプリケーションレベルのpingを送り、pongが続けて返らなければ接続を切る
+
+        トレードが無いだけのアドレスは再接続しない（判定はpongのみで行う）
+        """
+        while True:
+            await asyncio.sleep(WEBSOCKET_PING_INTERVAL)
+            if self.ping_sent_at is not None:
+                self.missed_pongs += 1
+                metrics.inc('hl_ws_missed_pongs_total', (('connection', self.name),))
+                if self.missed_pongs >= WEBSOCKET_MAX_MISSED_PONGS:
+                    logger.warning("[%s] No pong for %d consecutive pings. Dropping connection.", self.name, self.missed_pongs)
+                    metrics.inc('hl_ws_heartbeat_timeouts_total', (('connection', self.name),))
+                    # 応答しない接続はcloseハンドシェイクを待たずに切る
+                    self.ws.transport.abort()
+                    return
+            self.ping_sent_at = time.perf_counter()
+            await self._send({"method": "ping"})
+
+    def _on_pong(self):
+        if self.ping_sent_at is None:
+            return
+        self.rtt_history.append(time.perf_counter() - self.ping_sent_at)
+        self.ping_sent_at = None
+        self.missed_pongs = 0
+        touch_healthcheck_file()
+
+    def rtt_stats(self) -> dict:
+        """直近のRTT（秒）の統計"""
+        if not self.rtt_history:
+            return {}
+        history = self.rtt_history
+        return {'last': history[-1], 'avg': sum(history) / len(history), 'max': max(history)}
+
+    def _dispatch(self, message):
+        if not isinstance(message, str) or not message.startswith("{"):
+            return
+        ws_msg = json.loads(message)
+        channel = ws_msg.get("channel")
+        if channel == "pong":
+            self._on_pong()
+            return
+        if channel != "userFills":
+            return
+        data = ws_msg.get("data", {})
+        address = self.addresses.get(str(data.get("user", "")).lower())
+        if address is None:
+            return
+        # ウォーターマークは処理順に進むため、約定時刻の古い順に処理する
+        fills = sorted((fill for fill in data.get("fills", []) if isinstance(fill, dict)), key=lambda fill: int(fill.get("time", 0)))
+        historical = classify_historical_fills(address, fills, bool(data.get("isSnapshot")))
+        # 処理は専用スレッドに任せ、受信ループは止めない
+        for fill, is_historical in zip(fills, historical):
+            ingest_queue.put(address, fill, is_historical)
+
+    async def connect(self):
+        """接続して全アドレスを購読する"""
+        self.ws = await websockets.connect(HYPERLIQUID_WS_URL, ping_interval=None, open_timeout=10, close_timeout=WEBSOCKET_CLOSE_TIMEOUT, max_size=2 ** 24)
+        for address in self.addresses.values():
+            start_grace_period(address)
+            await self._subscribe(address)
+        if STATE_SNAPSHOT_PATH:
+            logger.info("[%s] Connected and subscribed %d addresses. Skipping snapshot fills up to each address's watermark.", self.name, len(self.addresses))
+        else:
+            logger.info("[%s] Connected and subscribed %d addresses. Grace period active for %ds.", self.name, len(self.addresses), STARTUP_GRACE_SECONDS)
+
+    async def receive(self):
+        """切断されるまで受信する"""
+        ping_task = asyncio.create_task(self._ping_loop())
+        try:
+            async for message in self.ws:
+                self._dispatch(message)
+        finally:
+            ping_task.cancel()
+
+    async def close(self):
+        """close応答を待つのはWEBSOCKET_CLOSE_TIMEOUT秒まで。応答がなければソケットを破棄する"""
+        if self.ws is None:
+            return
+        ws, self.ws = self.ws, None
+        # ws.close()はキャンセルを握りつぶしてclose_timeoutを2回待つため、wait_forではなく外から打ち切る
+        closing = asyncio.ensure_future(ws.close())
+        done, _ = await asyncio.wait({closing}, timeout=WEBSOCKET_CLOSE_TIMEOUT)
+        if not done:
+            ws.transport.abort()
+            await closing
+
+def create_fill_handler(webhook_url: str, addr: str):
+    """インジェストキューに登録するアドレス毎のfill処理関数を作る"""
+    db_path = os.path.join(DB_DIRECTORY, f"trades_{addr[-8:]}.db")
+    def handler(fill, is_historical=False, coalesced=False, merged=()):
+        """インジェストキューのスレッドから呼ばれる（mergedはこのfillにまとめられた後続のfill）"""
+        trade = fill_to_trade(fill, addr)
+        if coalesced and not trade_aggregator:
+            # 過負荷時にまとめられたfillは保存のみ行い、通知は先頭のfillに件数と合計サイズを載せる
+            # ダイジェストには含める（再接続で再送された処理済みのfillは除く）
+            # 集約モードでは通常のfillと同じく集約バッファに積む
+            if processed_trades.add(fill_key(trade.address, trade.tx_hash, fill.get("tid"))) and trade_digests:
+                trade_digests.record(trade)
+            remember_trade(trade, 'coalesced')
+            if trade_archive:
+                trade_archive.enqueue(addr, fill)
             else:
-                print(f"[{address_index}] Monitor thread for {address} stopped. Reconnecting...")
+                ingest_queue.store_fill(db_path, fill)
+            return
+        if is_historical:
+            # 前回までに処理済みのfillは通知せず記録だけ残す（再購読のたびに同じ行を増やさない）
+            processed_trades.add(fill_key(trade.address, trade.tx_hash, fill.get("tid")))
+            if trade_archive:
+                trade_archive.enqueue(addr, fill)
+            elif not check_trade_exists_in_db(db_path, trade.tx_hash, fill.get("tid"), trade.size, trade.price):
+                ingest_queue.store_fill(db_path, fill)
+            return
+        merged_trades = []
+        if merged and not trade_aggregator:
+            merged_trades = [fill_to_trade(extra, addr) for extra in merged]
+            merged_trades = [
+                other for other, extra in zip(merged_trades, merged)
+                if fill_key(other.address, other.tx_hash, extra.get("tid")) not in processed_trades
+            ]
+        if trade_archive:
+            # 共通DBへの書き込みは通知判定の後（書き込み済みのfillは重複として扱われるため）
+            process_trade_with_db(webhook_url, trade, db_path, fill.get("tid"), merged_trades)
+            trade_archive.enqueue(addr, fill)
+            return
+        # 存在チェックは自分自身を書き込む前に行う
+        try:
+            return process_trade_with_db(webhook_url, trade, db_path, fill.get("tid"), merged_trades)
+        finally:
+            ingest_queue.store_fill(db_path, fill)
+    return handler
+
+
+async def monitor_shard_async(webhook_url: str, addresses: list, shard_index: int, start_delay: float = 0):
+    """1本のWebSocketで1つ以上のアドレスを監視し、切断時に自動再接続する"""
+    global monitor_instances
+
+    name = f"shard {shard_index}" if len(addresses) > 1 else str(shard_index)
 
+    if start_delay:
+        await asyncio.sleep(start_delay)
+
+    first_attempt = True
+    while True:  # The main reconnection loop
+        if not first_attempt:
+            await reconnect_scheduler.wait_before_reconnect(name)
+        first_attempt = False
+
+        connection = AsyncConnection(name)
+        for address in addresses:
+            connection.add_address(address)
+            monitor_instances[address] = connection
+        try:
+            logger.info("[%s] Initializing connection for %d address(es)", name, len(addresses))
+            async with reconnect_scheduler.handshake(name):
+                await connection.connect()
+            reconnect_scheduler.record_connected(name, addresses)
+            startup_tracker.mark_ready(shard_index)
+            await connection.receive()
+            logger.warning("[%s] Connection closed. Reconnecting...", name)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            sys.stderr.write(f"[{address_index}] An exception occurred in the monitor loop for {address}: {e}\n")
-        
+            metrics.inc('hl_errors_total', (('stage', 'connection'),))
+            logger.error("[%s] An exception occurred in the monitor loop: %s", name, e)
         finally:
-            if address in monitor_instances:
-                try:
-                    print(f"[{address_index}] Cleaning up monitor instance for {address}.")
-                    monitor_instances[address].stop()
-                except Exception as e:
-                    sys.stderr.write(f"[{address_index}] Error stopping monitor during cleanup: {e}\n")
-                del monitor_instances[address]
-            
-            wait_time = 30
-            print(f"[{address_index}] Waiting {wait_time} seconds before reconnecting {address}...")
-            await asyncio.sleep(wait_time)
+            metrics.inc('hl_reconnects_total', (('connection', name),))
+            reconnect_scheduler.record_disconnect(name)
+            await connection.close()
+            for address in addresses:
+                if monitor_instances.get(address) is connection:
+                    del monitor_instances[address]
 
-async def run_multi_monitor_async(webhook_url: str, addresses: list):
-    """複数アドレスの非同期監視"""
-    print(f"Starting multi-address monitor for {len(addresses)} addresses")
-    
-    # 各アドレスの監視タスクを作成
-    tasks = []
-    for i, address in enumerate(addresses):
+def collect_monitor_gauges():
+    """スクレイプ時にキュー長・キャッシュ・接続状態を集計する"""
+    if notification_router is not None:
+        for name, sink in list(notification_router.sinks.items()):
+            for lane, lane_queue in sink.queues.items():
+                yield 'hl_sink_queue_depth', (('sink', sink.name), ('type', sink.kind), ('lane', lane)), lane_queue.qsize()
+    for cache_name, cache in (('processed_trades', processed_trades), ('trade_cache', trade_cache)):
+        for key, value in cache.stats().items():
+            yield f'hl_dedup_cache_{key}', (('cache', cache_name),), value
+    yield 'hl_connected_addresses', (), len(monitor_instances)
+    if ingest_queue:
+        for key, value in ingest_queue.stats().items():
+            yield f'hl_ingest_{key}', (), value
+    startup = startup_tracker.stats()
+    yield 'hl_startup_shards_ready', (), startup['ready_shards']
+    yield 'hl_startup_shards_total', (), startup['total_shards']
+    if startup['startup_seconds'] is not None:
+        yield 'hl_startup_seconds', (), startup['startup_seconds']
+    if trade_archive:
+        yield 'hl_archive_queue_depth', (), trade_archive.queue.qsize()
+    for connection in set(monitor_instances.values()):
+        for key, value in connection.rtt_stats().items():
+            yield f'hl_ws_rtt_{key}_seconds', (('connection', connection.name),), value
+    for address, stats in reconnect_scheduler.recovery_stats().items():
+        yield 'hl_reconnect_recovery_last_seconds', (('address', address),), stats['last']
+
+metrics.add_collector(collect_monitor_gauges)
+
+def json_response(data) -> tuple:
+    return "application/json", json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+async def query_recent_trades(query: dict) -> tuple:
+    """GET /trades?address=&coin=&limit= 直近のトレード（新しい順）。足りない分はDBから補う"""
+    address = query.get('address', '').lower()
+    coin = query.get('coin')
+    try:
+        limit = max(1, min(int(query.get('limit', 50)), 1000))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+    trades = []
+    # 処理スレッドが追加中でも安全なようにコピーしてから走査する
+    for trade in reversed(list(recent_trades)):
+        if address and trade['address'].lower() != address:
+            continue
+        if coin and trade['coin'] != coin:
+            continue
+        trades.append(trade)
+        if len(trades) >= limit:
+            break
+
+    source = 'memory'
+    if len(trades) < limit and (address or trade_archive):
+        # 監視中のアドレス表記（大文字小文字）に揃えてDBを引く
+        db_address = next((known for known in monitor_tasks if known.lower() == address), address)
+        try:
+            stored = await asyncio.to_thread(load_trades_from_db, db_address, coin, limit)
+        except sqlite3.Error as e:
+            logger.warning("SQLite error reading trades: %s", e)
+            stored = []
+        seen = {(trade['tx_hash'], trade['size'], trade['price']) for trade in trades}
+        for trade in stored:
+            if len(trades) >= limit:
+                break
+            if (trade['tx_hash'], trade['size'], trade['price']) not in seen:
+                trades.append(trade)
+                source = 'memory+sqlite'
+    return json_response({'source': source, 'count': len(trades), 'trades': trades})
+
+def query_monitor_state(query: dict) -> tuple:
+    """GET /state 接続・キュー・通知抑制の状態"""
+    now = time.time()
+    connections = {}
+    for address, task in list(monitor_tasks.items()):
+        connection = monitor_instances.get(address)
+        connections[address] = {
+            'connection': connection.name if connection else None,
+            'connected': bool(connection and connection.ws is not None),
+            'task_running': not task.done(),
+            'missed_pongs': connection.missed_pongs if connection else None,
+            'rtt_seconds': connection.rtt_stats() if connection else {},
+        }
+    queues = {}
+    if notification_router is not None:
+        for sink in notification_router.sinks.values():
+            queues[sink.name] = {lane: lane_queue.qsize() for lane, lane_queue in sink.queues.items()}
+    if trade_archive:
+        queues['archive'] = trade_archive.queue.qsize()
+    suppression = [
+        {'address': address, 'coin': coin, 'direction': direction,
+         'remaining_seconds': round(NOTIFICATION_SUPPRESSION_SECONDS - (now - last_time), 1)}
+        for (address, coin, direction), last_time in list(last_notification_time.items())
+        if now - last_time < NOTIFICATION_SUPPRESSION_SECONDS
+    ]
+    return json_response({
+        'pid': os.getpid(),
+        'worker': worker_assignment[0] if worker_assignment else None,
+        'connections': connections,
+        'queues': queues,
+        'suppression': suppression,
+        'aggregating': len(trade_aggregator.buckets) if trade_aggregator else 0,
+        'dedup': {'processed_trades': processed_trades.stats(), 'trade_cache': trade_cache.stats()},
+        'recent_trades': len(recent_trades),
+        'ingest': ingest_queue.stats() if ingest_queue else {},
+        'startup': startup_tracker.stats(),
+    })
+
+http_routes['/trades'] = query_recent_trades
+http_routes['/state'] = query_monitor_state
+
+class StartupTracker:
+    """起動時のshardが購読を終えるたびにヘルスチェックファイルへ準備状況を書き、全shardの完了時間を記録する"""
+
+    def __init__(self):
+        self.pending = set()
+        self.total = 0
+        self.first_ready_seconds = None
+        self.startup_seconds = None
+
+    def expect(self, shard_indexes: list):
+        self.pending.update(shard_indexes)
+        self.total += len(shard_indexes)
+
+    def mark_ready(self, shard_index: int):
+        if shard_index not in self.pending:
+            return
+        self.pending.discard(shard_index)
+        elapsed = time.perf_counter() - PROCESS_STARTED_AT
+        if self.first_ready_seconds is None:
+            self.first_ready_seconds = elapsed
+        if not self.pending:
+            self.startup_seconds = elapsed
+            logger.info("All %d shards subscribed in %.2fs (first after %.2fs)", self.total, elapsed, self.first_ready_seconds)
+        self.write_healthcheck()
+
+    def stats(self) -> dict:
+        return {
+            'ready_shards': self.total - len(self.pending),
+            'total_shards': self.total,
+            'first_ready_seconds': self.first_ready_seconds,
+            'startup_seconds': self.startup_seconds,
+        }
+
+    def write_healthcheck(self):
+        """準備状況をヘルスチェックファイルに書き出す（mtimeも更新される）"""
+        stats = self.stats()
+        content = f"ready {stats['ready_shards']}/{stats['total_shards']} shards\n"
+        if self.startup_seconds is not None:
+            content += f"startup_seconds {self.startup_seconds:.3f}\n"
+        try:
+            tmp_path = HEALTHCHECK_FILE + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.replace(tmp_path, HEALTHCHECK_FILE)
+        except OSError as e:
+            logger.warning("Failed to write healthcheck file: %s", e)
+
+startup_tracker = StartupTracker()
+
+shard_members = {}
+next_shard_index = 0
+monitor_failed = None
+
+def spawn_monitor_tasks(webhook_url: str, addresses: list, startup: bool = False):
+    """アドレスをshardに分けて監視タスクを起動する
+
+    起動時はSTARTUP_WAVE_SIZE個ずつSTARTUP_WAVE_INTERVAL秒間隔で接続を始める
+    """
+    global next_shard_index
+
+    # 共有接続モードではshard毎、それ以外はアドレス毎に1本のWebSocketを張る
+    shard_size = MULTIPLEX_SHARD_SIZE if MULTIPLEX_SHARD_SIZE > 0 else 1
+    shards = split_into_shards(addresses, shard_size)
+    if startup:
+        startup_tracker.expect(list(range(next_shard_index, next_shard_index + len(shards))))
+    for position, shard in enumerate(shards):
+        shard_index = next_shard_index
+        next_shard_index += 1
+        start_delay = (position // max(1, STARTUP_WAVE_SIZE)) * STARTUP_WAVE_INTERVAL if startup else 0
         task = asyncio.create_task(
-            monitor_address_async(webhook_url, address, i)
+            monitor_shard_async(webhook_url, shard, shard_index, start_delay)
         )
-        tasks.append(task)
-        monitor_tasks[address] = task
-        print(f"Created monitoring task for address {i}: {address}")
-    
+        task.add_done_callback(on_monitor_task_done)
+        shard_members[task] = shard
+        for address in shard:
+            monitor_tasks[address] = task
+            ingest_queue.register(address, create_fill_handler(webhook_url, address))
+        logger.info("Created monitoring task %d for %d address(es): %s%s", shard_index, len(shard), shard[0], ' ...' if len(shard) > 1 else '')
+
+def on_monitor_task_done(task):
+    """監視タスクが例外で終了した場合はメインループに伝える（キャンセルは除外）"""
+    shard_members.pop(task, None)
+    if task.cancelled():
+        return
+    if monitor_failed is not None and not monitor_failed.done():
+        monitor_failed.set_exception(task.exception() or RuntimeError("Monitor task exited"))
+
+def remove_monitored_address(address: str):
+    """アドレスの監視を止める。shardが空になったらタスクごとキャンセル"""
+    task = monitor_tasks.pop(address, None)
+    if task is None:
+        return
+    shard = shard_members.get(task, [])
+    if address in shard:
+        shard.remove(address)
+    connection = monitor_instances.pop(address, None)
+    if connection is not None:
+        asyncio.ensure_future(connection.remove_address(address))
+    ingest_queue.unregister(address)
+    startup_grace_period.pop(address, None)
+    fill_watermarks.pop(address, None)
+    if not shard:
+        task.cancel()
+
+def reload_addresses(webhook_url: str, addresses_file: str):
+    """アドレスファイルを再読込し、差分のみ監視を追加・削除する"""
     try:
-        # すべてのタスクを並行実行
-        await asyncio.gather(*tasks)
-    except Exception as e:
-        print(f"Error in multi-monitor: {e}")
-        raise
+        all_addresses = read_addresses(addresses_file)
+    except IOError as e:
+        logger.error("Error reloading addresses file: %s", e)
+        return
+    if not all_addresses:
+        logger.warning("No addresses found in addresses file, keeping current addresses")
+        return
 
-def signal_handler(signum, frame):
-    global monitor_instances, main_loop
-    print(f"Received signal {signum}, shutting down...")
-    
-    # パッチを元に戻す
-    signal.signal = original_signal
-    
-    # すべての監視インスタンスを停止
-    for address, monitor in monitor_instances.items():
+    addresses = owned_addresses(all_addresses)
+    current = set(monitor_tasks)
+    added = [address for address in addresses if address not in current]
+    removed = current - set(addresses)
+    if not added and not removed:
+        return
+    logger.info("Addresses file changed: %d added, %d removed", len(added), len(removed))
+    for address in removed:
+        logger.info("Stopping monitor for removed address", extra={'address': address})
+        remove_monitored_address(address)
+    if added:
+        spawn_monitor_tasks(webhook_url, added)
+
+async def watch_addresses_file(webhook_url: str, addresses_file: str):
+    """アドレスファイルのmtimeを監視して変更時に再読込する"""
+    last_mtime = os.path.getmtime(addresses_file)
+    while True:
+        await asyncio.sleep(ADDRESSES_RELOAD_INTERVAL)
+        try:
+            mtime = os.path.getmtime(addresses_file)
+        except OSError:
+            continue
+        if mtime != last_mtime:
+            last_mtime = mtime
+            reload_addresses(webhook_url, addresses_file)
+
+def warm_up(webhook_url: str):
+    """最初のトレードの前に通知先とトレード処理で使うモジュールを準備する"""
+    init_notification_router(webhook_url)
+    hyperliquid_types.Trade
+    hyperliquid_database.TradeDatabase
+
+def on_warm_up_done(task):
+    if task.cancelled() or task.exception() is None:
+        return
+    if monitor_failed is not None and not monitor_failed.done():
+        monitor_failed.set_exception(task.exception())
+
+async def run_multi_monitor_async(webhook_url: str, addresses: list, addresses_file: str = None):
+    """複数アドレスの非同期監視"""
+    global monitor_failed
+    logger.info("Starting multi-address monitor for %d addresses", len(addresses))
+
+    if METRICS_PORT > 0:
+        await start_http_server()
+
+    loop = asyncio.get_running_loop()
+    monitor_failed = loop.create_future()
+    stop_requested = loop.create_future()
+
+    def request_stop(signum):
+        logger.info("Received signal %d, shutting down...", signum)
+        if not stop_requested.done():
+            stop_requested.set_result(signum)
+
+    # 停止はイベントループ上で行い、後片付けはrun_monitorでまとめて行う
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, request_stop, signum)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            signal.signal(signum, lambda signum, frame: loop.call_soon_threadsafe(request_stop, signum))
+    # 定期処理のタスク。終了時にキャンセルして終わるのを待つ
+    background_tasks = []
+    if state_snapshot:
         try:
-            print(f"Stopping monitor for {address}")
-            monitor.stop()
+            state_snapshot.load()
         except Exception as e:
-            print(f"Error stopping monitor for {address}: {e}")
+            logger.error("Failed to load state snapshot: %s", e)
+        background_tasks.append(asyncio.create_task(checkpoint_state(state_snapshot)))
+    spawn_monitor_tasks(webhook_url, addresses, startup=True)
+    # ハンドラが揃ってから前回の退避分を処理する
+    ingest_queue.resume_leftover()
+    startup_tracker.write_healthcheck()
+    # 通知先の初期化と重いimportは接続と並行してスレッドで行う
+    warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up, webhook_url))
+    warm_up_task.add_done_callback(on_warm_up_done)
+    if trade_aggregator:
+        background_tasks.append(asyncio.create_task(run_aggregation_flusher()))
+    if trade_digests:
+        background_tasks.append(asyncio.create_task(run_digest_flusher(webhook_url)))
+
+    if addresses_file:
+        # SIGHUPまたはファイル更新でアドレスを再読込
+        try:
+            loop.add_signal_handler(signal.SIGHUP, reload_addresses, webhook_url, addresses_file)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass
+        if ADDRESSES_RELOAD_INTERVAL > 0:
+            background_tasks.append(asyncio.create_task(watch_addresses_file(webhook_url, addresses_file)))
     
+    try:
+        # シグナルを受けるか、監視タスクが例外で終了するまで待つ
+        await asyncio.wait([monitor_failed, stop_requested], return_when=asyncio.FIRST_COMPLETED)
+        if monitor_failed.done():
+            monitor_failed.result()
+    except Exception as e:
+        logger.error("Error in multi-monitor: %s", e)
+        raise
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await stop_monitor_tasks()
+
+async def stop_monitor_tasks():
+    """監視タスクをキャンセルし、各接続が閉じるのを待つ"""
+    tasks = list(shard_members)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=WEBSOCKET_CLOSE_TIMEOUT + 1)
     monitor_instances.clear()
-    
-    if main_loop and main_loop.is_running():
-        main_loop.stop()
-    
-    sys.exit(0)
 
-def start_daemon(script_path, addresses_file):
-    """単一プロセスでのデーモン起動"""
+def start_daemon(script_path, addresses_file, workers: int = 1):
+    """単一プロセスでのデーモン起動（workers > 1 の場合はスーパーバイザーとして起動）"""
     log_file = '/tmp/hyperliquid_monitor_multi.log'
     error_file = '/tmp/hyperliquid_monitor_multi_error.log'
     pidfile = '/tmp/hyperliquid_monitor_multi.pid'
@@ -410,6 +2440,8 @@ def start_daemon(script_path, addresses_file):
     remove_pidfile(pidfile)
     
     cmd = [sys.executable, script_path, addresses_file, '--background']
+    if workers > 1:
+        cmd += ['--workers', str(workers)]
     
     print(f"Starting multi-address daemon with command: {' '.join(cmd)}")
     print(f"Logs will be written to: {log_file}")
@@ -449,48 +2481,208 @@ def start_daemon(script_path, addresses_file):
         print(f"Failed to start multi-address daemon: {e}")
         return False
 
+def worker_for_address(address: str, workers: int) -> int:
+    """Rendezvous hashでアドレスの担当ワーカーを決める（ワーカー数が変わっても移動は最小限）"""
+    key = address.lower().encode()
+    return max(
+        range(workers),
+        key=lambda index: hashlib.blake2b(key, digest_size=8, salt=str(index).encode()).digest()
+    )
+
+def owned_addresses(addresses: list) -> list:
+    """ワーカーモードでは自分が担当するアドレスだけを返す"""
+    if worker_assignment is None:
+        return addresses
+    index, workers = worker_assignment
+    return [address for address in addresses if worker_for_address(address, workers) == index]
+
+def worker_env(index: int) -> dict:
+    """ワーカー毎にファイルやポートが衝突しないよう環境変数を分ける"""
+    env = dict(os.environ)
+    suffix = f".worker{index}"
+    env['HEALTHCHECK_FILE'] = HEALTHCHECK_FILE + suffix
+    for name in ('ARCHIVE_DB_PATH', 'STATE_SNAPSHOT_PATH'):
+        if env.get(name):
+            env[name] += suffix
+    env['INGEST_SPILL_PATH'] = (INGEST_SPILL_PATH or os.path.join(DB_DIRECTORY, "ingest_spill.jsonl")) + suffix
+    if METRICS_PORT > 0:
+        env['METRICS_PORT'] = str(METRICS_PORT + 1 + index)
+    return env
+
+class WorkerSupervisor:
+    """ワーカープロセスを起動・監視し、落ちたら再起動する"""
+
+    def __init__(self, script_path: str, addresses_file: str, workers: int):
+        self.script_path = script_path
+        self.addresses_file = addresses_file
+        self.workers = workers
+        self.processes = {}
+        self.restart_at = {}
+        self.restart_delay = defaultdict(lambda: 1.0)
+        self.started_at = {}
+        self.stopping = False
+
+    def start_worker(self, index: int):
+        cmd = [sys.executable, self.script_path, self.addresses_file,
+               '--workers', str(self.workers), '--worker-index', str(index)]
+        self.processes[index] = subprocess.Popen(cmd, env=worker_env(index), stdin=subprocess.DEVNULL)
+        self.started_at[index] = time.time()
+        logger.info("Started worker %d with PID %d", index, self.processes[index].pid)
+
+    def check_workers(self):
+        now = time.time()
+        for index in range(self.workers):
+            process = self.processes.get(index)
+            if process is not None and process.poll() is None:
+                if now - self.started_at[index] >= RECONNECT_STABLE_SECONDS:
+                    self.restart_delay[index] = 1.0
+                continue
+            if process is not None:
+                delay = self.restart_delay[index]
+                self.restart_at[index] = now + delay
+                self.restart_delay[index] = min(delay * 2, 60)
+                self.processes[index] = None
+                logger.error("Worker %d exited with code %s, restarting in %.0fs", index, process.returncode, delay)
+            if now >= self.restart_at.get(index, 0):
+                self.start_worker(index)
+
+    def aggregate_health(self):
+        """全ワーカーが生きている場合のみ、最も古いワーカーのヘルスチェック時刻を反映する
+
+        1つでも古いワーカーがあれば全体も古くなる。ヘルスチェックファイルのないワーカーは不健全として扱う
+        """
+        if any(process is None or process.poll() is not None for process in self.processes.values()):
+            return
+        mtimes = []
+        for index in range(self.workers):
+            try:
+                mtimes.append(os.path.getmtime(HEALTHCHECK_FILE + f".worker{index}"))
+            except OSError:
+                return
+        try:
+            with open(HEALTHCHECK_FILE, 'a'):
+                pass
+            oldest = min(mtimes)
+            os.utime(HEALTHCHECK_FILE, (oldest, oldest))
+        except OSError as e:
+            logger.warning("Failed to update healthcheck file: %s", e)
+
+    def forward_signal(self, signum, frame):
+        if signum == getattr(signal, 'SIGHUP', None):
+            for process in self.processes.values():
+                if process is not None and process.poll() is None:
+                    process.send_signal(signum)
+            return
+        logger.info("Received signal %d, stopping workers...", signum)
+        self.stopping = True
+
+    def stop_workers(self, timeout: float = None):
+        """SIGTERMを送り、各ワーカーがfillの処理・通知・スナップショット保存を終えるのを待つ"""
+        timeout = WORKER_STOP_TIMEOUT if timeout is None else timeout
+        running = {index: process for index, process in self.processes.items() if process is not None and process.poll() is None}
+        for process in running.values():
+            process.terminate()
+        deadline = time.time() + timeout
+        for index, process in running.items():
+            try:
+                process.wait(max(0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                logger.error("Worker %d did not stop within %.0fs, killing it", index, timeout)
+                process.kill()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.forward_signal)
+        signal.signal(signal.SIGINT, self.forward_signal)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.forward_signal)
+        logger.info("Supervisor PID: %d, starting %d workers", os.getpid(), self.workers)
+        try:
+            while not self.stopping:
+                self.check_workers()
+                self.aggregate_health()
+                time.sleep(1)
+        finally:
+            self.stop_workers()
+            logger.info("All workers stopped.")
+
 def run_monitor(webhook_url: str, addresses_file: str, background_mode: bool = False):
     """メイン監視ループ（複数アドレス対応）"""
     global main_loop
     
-    addresses = load_addresses(addresses_file)
+    addresses = owned_addresses(load_addresses(addresses_file))
     
-    print(f"Loading {len(addresses)} addresses:")
+    if DB_DIRECTORY != '.':
+        logger.info("Database directory set to: %s", DB_DIRECTORY)
+    logger.info("Loading %d addresses:", len(addresses))
     for i, addr in enumerate(addresses):
-        print(f"  {i+1}: {addr}")
-    
-    # シグナルハンドラーの設定
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+        logger.info("  %d: %s", i + 1, addr)
     
-    print(f"Process PID: {os.getpid()}")
+    logger.info("Process PID: %d", os.getpid())
+    init_trade_archive()
+    init_ingest_queue()
     
     try:
         # 新しいイベントループを作成して実行
         if sys.version_info >= (3, 7):
-            asyncio.run(run_multi_monitor_async(webhook_url, addresses))
+            asyncio.run(run_multi_monitor_async(webhook_url, addresses, addresses_file))
         else:
             # Python 3.6以下の場合
             loop = asyncio.get_event_loop()
             main_loop = loop
-            loop.run_until_complete(run_multi_monitor_async(webhook_url, addresses))
+            loop.run_until_complete(run_multi_monitor_async(webhook_url, addresses, addresses_file))
             
     except KeyboardInterrupt:
-        print("Keyboard interrupt received, stopping...")
+        logger.info("Keyboard interrupt received, stopping...")
     except Exception as e:
-        error_msg = f"Multi-monitor error: {e}"
-        print(error_msg)
+        logger.error("Multi-monitor error: %s", e)
         sys.exit(1)
     finally:
-        # クリーンアップ
-        for address, monitor in monitor_instances.items():
-            try:
-                monitor.stop()
-            except:
-                pass
-        monitor_instances.clear()
+        shutdown_pipeline()
+
+def shutdown_pipeline():
+    """終了時の後片付け。通知を生む処理をすべて終えてから、最後に一度だけシンクを止める
+
+    インジェストキューの処理 -> 集約バッファの送信 -> シンクの送信待ち -> DB・スナップショット の順
+    """
+    if ingest_queue:
+        ingest_queue.stop()
+        if ingest_queue.worker.is_alive():
+            logger.warning("Ingest queue did not drain in time, remaining fills are not notified")
+    if trade_aggregator:
+        trade_aggregator.flush_due(flush_all=True)
+    stop_delivery_queues()
+    trade_lookup_pool.close()
+    if trade_archive:
+        trade_archive.close()
+    if state_snapshot:
+        try:
+            state_snapshot.save()
+        except Exception as e:
+            logger.error("Failed to save state snapshot: %s", e)
+    stop_logging()
+
+def query_running_monitor(path: str, workers: int = 1) -> bool:
+    """起動中のモニター（ワーカーモードでは全ワーカー）のHTTPエンドポイントを叩いて表示する"""
+    if METRICS_PORT <= 0:
+        sys.stderr.write("METRICS_PORT is not set; the query endpoint is disabled\n")
+        return False
+    if not path.startswith("/"):
+        path = "/" + path
+    ports = [METRICS_PORT] if workers <= 1 else [METRICS_PORT + 1 + index for index in range(workers)]
+    ok = True
+    for port in ports:
+        try:
+            response = requests.get(f"http://{METRICS_HOST}:{port}{path}", timeout=10)
+            print(response.text, end="")
+            ok = ok and response.ok
+        except requests.exceptions.RequestException as e:
+            sys.stderr.write(f"Failed to query {METRICS_HOST}:{port}: {e}\n")
+            ok = False
+    return ok
 
 def main():
+    global worker_assignment
+
     parser = argparse.ArgumentParser(
         description="Hyperliquid Trade Monitor (Multi-Address WebSocket Support)",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -505,6 +2697,23 @@ def main():
         action="store_true",
         help="Run as background daemon (single process monitoring all addresses)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes; addresses are split across them by consistent hash"
+    )
+    parser.add_argument(
+        "--worker-index",
+        type=int,
+        default=None,
+        help=argparse.SUPPRESS
+    )
+    parser.add_argument(
+        "--query",
+        metavar="PATH",
+        help="Query a running monitor's HTTP endpoint and print the result, e.g. '/trades?coin=BTC' or '/state' (requires METRICS_PORT)"
+    )
     parser.add_argument(
         "--background",
         action="store_true",
@@ -517,6 +2726,9 @@ def main():
 
     args = parser.parse_args()
 
+    if args.query:
+        sys.exit(0 if query_running_monitor(args.query, args.workers) else 1)
+
     webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
     if not webhook_url:
         sys.stderr.write("Error: DISCORD_WEBHOOK_URL not found in environment variables.\n")
@@ -531,10 +2743,23 @@ def main():
         script_path = os.path.abspath(sys.argv[0])
         addresses = load_addresses(args.addresses_file)
         
-        print(f"Starting daemon for {len(addresses)} addresses in single process")
-        start_daemon(script_path, args.addresses_file)
+        if args.workers > 1:
+            print(f"Starting daemon for {len(addresses)} addresses across {args.workers} worker processes")
+        else:
+            print(f"Starting daemon for {len(addresses)} addresses in single process")
+        start_daemon(script_path, args.addresses_file, args.workers)
+        sys.exit(0)
+
+    setup_logging()
+
+    if args.workers > 1 and args.worker_index is None:
+        load_addresses(args.addresses_file)
+        WorkerSupervisor(os.path.abspath(sys.argv[0]), args.addresses_file, args.workers).run()
         sys.exit(0)
 
+    if args.worker_index is not None:
+        worker_assignment = (args.worker_index, args.workers)
+
     run_monitor(webhook_url, args.addresses_file, args.background)
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+import importlib.util
+import os
+
+import pytest
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hyperliquid-discord-monitor.py")
+
+
+@pytest.fixture
+def monitor(monkeypatch, tmp_path):
+    """テスト毎にモジュールの状態（キャッシュ・ウォーターマーク等）が空のスクリプトを読み込む"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DB_DIRECTORY", str(tmp_path))
+    spec = importlib.util.spec_from_file_location("hyperliquid_discord_monitor", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
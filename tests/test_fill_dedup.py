@@ -0,0 +1,49 @@
+import os
+
+
+def make_fill(tid, size=1.0, price=100.0, tx_hash="0xabc"):
+    return {
+        "coin": "BTC", "px": str(price), "sz": str(size), "side": "B", "time": 1700000000000 + tid,
+        "hash": tx_hash, "tid": tid, "dir": "Open Long", "closedPnl": "0",
+        "crossed": True, "startPosition": "0", "oid": 1, "fee": "0",
+    }
+
+
+def run_fills(monitor, fills, address="0x" + "a" * 40):
+    monitor.ingest_queue = monitor.IngestQueue(100, "spill", os.path.join(monitor.DB_DIRECTORY, "spill.jsonl"))
+    monitor.ingest_queue.register(address, monitor.create_fill_handler("http://webhook", address))
+    for fill in fills:
+        monitor.ingest_queue.put(address, fill)
+    monitor.ingest_queue.stop(5)
+
+
+def test_partial_fills_with_same_size_and_price_are_aggregated(monitor):
+    monitor.trade_aggregator = monitor.TradeAggregator(60)
+    run_fills(monitor, [make_fill(1), make_fill(2), make_fill(3), make_fill(4, size=2.0)])
+    bucket, = monitor.trade_aggregator.buckets.values()
+    assert (bucket["count"], bucket["size"]) == (4, 5.0)
+    assert [trade["status"] for trade in monitor.recent_trades] == ["aggregated"] * 4
+
+
+def test_fills_stored_by_a_previous_run_are_duplicates(monitor):
+    monitor.trade_aggregator = monitor.TradeAggregator(60)
+    run_fills(monitor, [make_fill(1), make_fill(2)])
+    monitor.processed_trades = monitor.BoundedDedupCache(1000, 3600, 1 << 20)
+    run_fills(monitor, [make_fill(1), make_fill(2), make_fill(3)])
+    statuses = [trade["status"] for trade in monitor.recent_trades]
+    assert statuses == ["aggregated", "aggregated", "duplicate", "duplicate", "aggregated"]
+
+
+def test_historical_fills_are_stored_once(monitor):
+    address = "0x" + "a" * 40
+    db_path = os.path.join(monitor.DB_DIRECTORY, f"trades_{address[-8:]}.db")
+    monitor.ingest_queue = monitor.IngestQueue(100, "spill", os.path.join(monitor.DB_DIRECTORY, "spill.jsonl"))
+    monitor.ingest_queue.register(address, monitor.create_fill_handler("http://webhook", address))
+    # 再購読で同じスナップショットが届いても行は増えない
+    for _ in range(2):
+        for fill in (make_fill(1), make_fill(2)):
+            monitor.ingest_queue.put(address, fill, is_historical=True)
+    monitor.ingest_queue.stop(5)
+    monitor.trade_lookup_pool.close()
+    assert len(monitor.load_trades_from_db(address, None, 10)) == 2
+    assert monitor.check_trade_exists_in_db(db_path, "0xabc", 2, 1.0, 100.0)
@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+
+
+def make_fill(index, coin="BTC", direction="Open Long", size=1.0):
+    return {
+        "coin": coin, "px": "100", "sz": str(size), "side": "B", "time": 1700000000000 + index,
+        "hash": f"0x{index:064x}", "tid": index, "dir": direction, "closedPnl": "0",
+        "crossed": True, "startPosition": "0", "oid": index, "fee": "0",
+    }
+
+
+class RecordingHandler:
+    """最初のfillで止まり、release()されるまで処理スレッドを塞ぐハンドラ"""
+
+    def __init__(self):
+        self.calls = []
+        self.blocked = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, fill, is_historical=False, coalesced=False, merged=()):
+        if not self.blocked.is_set():
+            self.blocked.set()
+            self.released.wait(5)
+        self.calls.append((fill["tid"], is_historical, coalesced))
+
+    def release(self):
+        self.released.set()
+
+
+def start_blocked_queue(monitor, tmp_path, policy, max_size=1):
+    """処理スレッドが1件目で止まった状態のキューを返す"""
+    queue = monitor.IngestQueue(max_size, policy, str(tmp_path / "spill.jsonl"))
+    handler = RecordingHandler()
+    queue.register("0xa", handler)
+    queue.put("0xa", make_fill(0))
+    assert handler.blocked.wait(5)
+    return queue, handler
+
+
+def test_spill_keeps_every_fill_in_order(monitor, tmp_path):
+    queue, handler = start_blocked_queue(monitor, tmp_path, "spill")
+    for index in range(1, 6):
+        queue.put("0xa", make_fill(index))
+    assert queue.stats()["spilled"] == 4
+    assert (tmp_path / "spill.jsonl").exists()
+    handler.release()
+    queue.stop(5)
+    assert [tid for tid, _, _ in handler.calls] == [0, 1, 2, 3, 4, 5]
+    assert not (tmp_path / "spill.jsonl").exists()
+    assert monitor.fill_watermarks["0xa"] == make_fill(5)["time"]
+
+
+def test_coalesce_merges_same_coin_and_direction(monitor, tmp_path):
+    queue, handler = start_blocked_queue(monitor, tmp_path, "coalesce")
+    queue.put("0xa", make_fill(1))
+    queue.put("0xa", make_fill(2))
+    queue.put("0xa", make_fill(3))
+    handler.release()
+    queue.stop(5)
+    assert handler.calls == [(0, False, False), (1, False, False), (2, False, True), (3, False, True)]
+    assert monitor.metrics.counters[("hl_ingest_coalesced_total", ())] == 2
+
+
+def test_coalesce_without_target_drops(monitor, tmp_path):
+    queue, handler = start_blocked_queue(monitor, tmp_path, "coalesce")
+    queue.put("0xa", make_fill(1))
+    queue.put("0xa", make_fill(2, coin="ETH"))
+    handler.release()
+    queue.stop(5)
+    assert [tid for tid, _, _ in handler.calls] == [0, 1]
+    assert monitor.metrics.counters[("hl_ingest_dropped_total", ())] == 1
+
+
+def test_drop_keeps_priority_trades(monitor, tmp_path):
+    monitor.PRIORITY_MIN_NOTIONAL = 1000
+    queue, handler = start_blocked_queue(monitor, tmp_path, "drop")
+    queue.put("0xa", make_fill(1))
+    queue.put("0xa", make_fill(2))
+    queue.put("0xa", make_fill(3, size=50))
+    handler.release()
+    queue.stop(5)
+    assert [tid for tid, _, _ in handler.calls] == [0, 1, 3]
+    assert monitor.metrics.counters[("hl_ingest_dropped_total", ())] == 1
+
+
+def test_watermark_advances_only_after_processing(monitor, tmp_path):
+    queue, handler = start_blocked_queue(monitor, tmp_path, "spill")
+    queue.put("0xa", make_fill(1))
+    assert "0xa" not in monitor.fill_watermarks
+    handler.release()
+    queue.stop(5)
+    assert monitor.fill_watermarks["0xa"] == make_fill(1)["time"]
+
+
+def test_leftover_spill_is_replayed_after_resume(monitor, tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    (tmp_path / "spill.jsonl.draining").write_text(json.dumps([time.time(), "0xa", make_fill(1), False]) + "\n")
+    spill_path.write_text(json.dumps([time.time(), "0xa", make_fill(2), False]) + "\n")
+    queue = monitor.IngestQueue(10, "spill", str(spill_path))
+    assert [path.rsplit(".", 1)[-1] for path in queue.leftover] == ["0", "1"]
+    handler = RecordingHandler()
+    handler.blocked.set()
+    queue.register("0xa", handler)
+    queue.put("0xa", make_fill(3))
+    time.sleep(0.2)
+    # ハンドラが揃うまでは前回分も新しいfillも処理しない
+    assert handler.calls == []
+    queue.resume_leftover()
+    queue.stop(5)
+    assert [tid for tid, _, _ in handler.calls] == [1, 2, 3]
+    assert not list(tmp_path.glob("spill.jsonl*"))
+
+
+def test_leftover_spill_is_kept_if_stopped_before_resume(monitor, tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    spill_path.write_text(json.dumps([time.time(), "0xa", make_fill(1), False]) + "\n")
+    queue = monitor.IngestQueue(10, "spill", str(spill_path))
+    queue.stop(5)
+    assert (tmp_path / "spill.jsonl.recovered.0").exists()
+    queue = monitor.IngestQueue(10, "spill", str(spill_path))
+    assert [path.rsplit(".", 1)[-1] for path in queue.leftover] == ["0"]
+    queue.stop(5)
+
+
+def put_coalesced(monitor, tmp_path, sizes):
+    """処理スレッドを別アドレスのfillで塞ぎ、同じcoin・directionのfillを1件にまとめさせる"""
+    address = "0x" + "b" * 40
+    monitor.ingest_queue = queue = monitor.IngestQueue(1, "coalesce", str(tmp_path / "spill.jsonl"))
+    blocker = RecordingHandler()
+    queue.register("0xa", blocker)
+    queue.register(address, monitor.create_fill_handler("http://webhook", address))
+    queue.put("0xa", make_fill(0))
+    assert blocker.blocked.wait(5)
+    for index, size in enumerate(sizes, start=1):
+        queue.put(address, make_fill(index, size=size))
+    blocker.release()
+    queue.stop(5)
+
+
+def test_coalesced_fills_reach_the_aggregator(monitor, tmp_path):
+    monitor.trade_aggregator = monitor.TradeAggregator(60)
+    put_coalesced(monitor, tmp_path, [1.0, 2.0, 3.0, 4.0])
+    bucket, = monitor.trade_aggregator.buckets.values()
+    assert (bucket["count"], bucket["size"]) == (4, 10.0)
+
+
+def test_coalesced_fills_are_summarized_in_the_head_notification(monitor, tmp_path, monkeypatch):
+    sent = []
+    monkeypatch.setattr(monitor, "dispatch_notification", lambda webhook_url, trade, message, priority=False, **extra: sent.append((message, extra)))
+    put_coalesced(monitor, tmp_path, [1.0, 2.0, 3.0, 4.0])
+    message, extra = sent[0]
+    assert len(sent) == 1
+    assert extra == {"coalesced_fills": 3, "total_size": 10.0}
+    assert "Coalesced: 4 fills, total size 10" in message
@@ -0,0 +1,67 @@
+import asyncio
+
+
+def make_scheduler(monitor, max_concurrent=2):
+    return monitor.ReconnectScheduler(base_delay=1, max_delay=30, max_concurrent=max_concurrent, stable_seconds=60)
+
+
+def test_backoff_is_bounded_by_failures_and_max_delay(monitor, monkeypatch):
+    monkeypatch.setattr(monitor.random, "uniform", lambda low, high: high)
+    scheduler = make_scheduler(monitor)
+    assert scheduler.backoff_delay("a") == 1
+    delays = []
+    for _ in range(6):
+        scheduler.record_disconnect("a")
+        delays.append(scheduler.backoff_delay("a"))
+    assert delays == [2, 4, 8, 16, 30, 30]
+
+
+def test_stable_connection_resets_failures(monitor, monkeypatch):
+    scheduler = make_scheduler(monitor)
+    scheduler.record_disconnect("a")
+    scheduler.record_disconnect("a")
+    now = monitor.time.time()
+    monkeypatch.setattr(monitor.time, "time", lambda: now)
+    scheduler.record_connected("a", ["0x1"])
+    # 安定時間に満たない切断は失敗として数える
+    monkeypatch.setattr(monitor.time, "time", lambda: now + 10)
+    scheduler.record_disconnect("a")
+    assert scheduler.failures["a"] == 3
+    scheduler.record_connected("a", ["0x1"])
+    monkeypatch.setattr(monitor.time, "time", lambda: now + 100)
+    scheduler.record_disconnect("a")
+    assert scheduler.failures["a"] == 0
+
+
+def test_recovery_stats_per_address(monitor, monkeypatch):
+    scheduler = make_scheduler(monitor)
+    monkeypatch.setattr(monitor.time, "time", lambda: 1000.0)
+    scheduler.record_disconnect("a")
+    monkeypatch.setattr(monitor.time, "time", lambda: 1004.0)
+    scheduler.record_connected("a", ["0x1", "0x2"])
+    stats = scheduler.recovery_stats()
+    assert stats["0x1"] == {"count": 1, "last": 4.0, "max": 4.0, "avg": 4.0}
+    assert set(stats) == {"0x1", "0x2"}
+
+
+def test_handshakes_are_limited_and_healthy_connections_go_first(monitor):
+    scheduler = make_scheduler(monitor, max_concurrent=1)
+    scheduler.failures["flaky"] = 5
+    order = []
+
+    async def connect(key, hold):
+        async with scheduler.handshake(key):
+            order.append(key)
+            await asyncio.sleep(hold)
+
+    async def run():
+        first = asyncio.create_task(connect("first", 0.05))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(connect("flaky", 0)), asyncio.create_task(connect("healthy", 0))]
+        await asyncio.sleep(0)
+        assert scheduler._in_flight == 1
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(run())
+    assert order == ["first", "healthy", "flaky"]
+    assert scheduler._in_flight == 0
@@ -0,0 +1,67 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+
+def make_trade(moment, pnl=0.0, coin="BTC", size=1.0, price=100.0, address="0xa"):
+    return SimpleNamespace(
+        timestamp=moment, address=address, coin=coin, size=size, price=price,
+        closed_pnl=pnl, direction="Close Long", tx_hash="0xh",
+    )
+
+
+def test_trades_are_bucketed_by_fill_time(monitor):
+    digests = monitor.TradeDigests(["hourly"])
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 59), pnl=5))
+    digests.record(make_trade(datetime(2026, 1, 1, 11, 1), pnl=-2))
+    # 遅れて届いた前の時間帯のfillは前の時間帯に入る
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 30), pnl=1, coin="ETH", size=10))
+    ten = datetime(2026, 1, 1, 10).timestamp()
+    bucket = digests.buckets[("hourly", "0xa", ten)]
+    assert bucket["trades"] == 2
+    assert bucket["pnl"] == 6
+    assert (bucket["wins"], bucket["losses"]) == (2, 0)
+    assert bucket["volume"] == {"BTC": 100.0, "ETH": 1000.0}
+    assert bucket["biggest"]["coin"] == "ETH"
+
+
+def test_take_due_waits_for_the_grace_period(monitor):
+    digests = monitor.TradeDigests(["hourly", "daily"])
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 59)))
+    digests.record(make_trade(datetime(2026, 1, 1, 11, 1)))
+    eleven = datetime(2026, 1, 1, 11).timestamp()
+    assert digests.take_due(eleven + 30) == {}
+    due = digests.take_due(eleven + digests.GRACE_SECONDS)
+    assert list(due) == [("hourly", datetime(2026, 1, 1, 10).timestamp())]
+    assert due[("hourly", datetime(2026, 1, 1, 10).timestamp())][0]["trades"] == 1
+    # 11時台と日次のバケットは残る
+    assert sorted(interval for interval, _, _ in digests.buckets) == ["daily", "hourly"]
+
+
+def test_dump_and_load_restore_every_period(monitor):
+    digests = monitor.TradeDigests(["hourly"])
+    digests.record(make_trade(datetime(2026, 1, 1, 11, 1), pnl=-1))
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 59), pnl=3))
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 59), address="0xb"))
+    restored = monitor.TradeDigests(["hourly"])
+    restored.load(digests.dump())
+    assert restored.buckets == digests.buckets
+    due = restored.take_due(datetime(2026, 1, 1, 12, 5).timestamp())
+    assert sorted(len(buckets) for buckets in due.values()) == [1, 2]
+
+
+def test_load_skips_disabled_intervals(monitor):
+    digests = monitor.TradeDigests(["hourly", "daily"])
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 59)))
+    restored = monitor.TradeDigests(["daily"])
+    restored.load(digests.dump())
+    assert [interval for interval, _, _ in restored.buckets] == ["daily"]
+
+
+def test_digest_message_lists_addresses_by_pnl(monitor):
+    digests = monitor.TradeDigests(["hourly"])
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 5), pnl=-4, address="0xloser"))
+    digests.record(make_trade(datetime(2026, 1, 1, 10, 6), pnl=9, address="0xwinner"))
+    (key, buckets), = digests.take_due(datetime(2026, 1, 1, 12).timestamp()).items()
+    message, = monitor.format_digest_messages(key[0], buckets)
+    assert message.startswith("**[2026-01-01 10:00 - 11:00] Hourly digest**")
+    assert message.index("0xwinner") < message.index("0xloser")
@@ -0,0 +1,44 @@
+import os
+
+
+class RunningProcess:
+    def poll(self):
+        return None
+
+
+def make_supervisor(monitor, tmp_path, workers=2):
+    monitor.HEALTHCHECK_FILE = str(tmp_path / "healthcheck.txt")
+    supervisor = monitor.WorkerSupervisor("monitor.py", "addresses.txt", workers)
+    supervisor.processes = {index: RunningProcess() for index in range(workers)}
+    return supervisor
+
+
+def touch(path, mtime):
+    path.write_text("ok")
+    os.utime(path, (mtime, mtime))
+
+
+def test_aggregate_health_uses_the_oldest_worker(monitor, tmp_path):
+    supervisor = make_supervisor(monitor, tmp_path)
+    touch(tmp_path / "healthcheck.txt.worker0", 1000)
+    touch(tmp_path / "healthcheck.txt.worker1", 5000)
+    supervisor.aggregate_health()
+    assert os.path.getmtime(tmp_path / "healthcheck.txt") == 1000
+
+
+def test_missing_worker_healthcheck_leaves_aggregate_stale(monitor, tmp_path):
+    supervisor = make_supervisor(monitor, tmp_path)
+    touch(tmp_path / "healthcheck.txt", 1000)
+    touch(tmp_path / "healthcheck.txt.worker0", 5000)
+    supervisor.aggregate_health()
+    assert os.path.getmtime(tmp_path / "healthcheck.txt") == 1000
+
+
+def test_dead_worker_leaves_aggregate_stale(monitor, tmp_path):
+    supervisor = make_supervisor(monitor, tmp_path)
+    supervisor.processes[1] = None
+    touch(tmp_path / "healthcheck.txt", 1000)
+    touch(tmp_path / "healthcheck.txt.worker0", 5000)
+    touch(tmp_path / "healthcheck.txt.worker1", 5000)
+    supervisor.aggregate_health()
+    assert os.path.getmtime(tmp_path / "healthcheck.txt") == 1000